@@ -0,0 +1,127 @@
+"""Time the API harvests and camera requests against local stub servers.
+
+python -m benchmarks.api_clients --latency 0.05 --error-rate 0.01
+
+For each client it prints the requests made, requests per second, total
+time and peak Python memory (tracemalloc) of the harvest. The stub runs in
+its own process; production hosts hard-coded in solids.camera are sent to
+it as well.
+"""
+import argparse
+import os
+import random
+import tempfile
+import tracemalloc
+from time import perf_counter
+from urllib.parse import urlparse
+
+from benchmarks.stub_servers import serve_in_process
+from solids.apis import harvest_omeka, harvest_portals, harvest_wikidata
+from solids.coordinates import CoordinateCache
+from solids.http_client import HttpClient
+
+
+class StubClient(HttpClient):
+    """HttpClient that sends every request to the stub server."""
+
+    def __init__(self, stub_url, **kwargs):
+        super().__init__(**kwargs)
+        self.stub = urlparse(stub_url)
+
+    def request(self, method, url, **kwargs):
+        url = urlparse(url)._replace(scheme=self.stub.scheme, netloc=self.stub.netloc)
+        return super().request(method, url.geturl(), **kwargs)
+
+
+def measure(name, client, harvest):
+    tracemalloc.start()
+    start = perf_counter()
+    harvest()
+    elapsed = perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    metrics = client.metrics().values()
+    requests = sum(stats["requests"] for stats in metrics)
+    retries = sum(stats["retries"] for stats in metrics)
+    print(
+        f"{name:<18} {requests:>8} {retries:>8} {requests / elapsed:>8.1f} "
+        f"{elapsed:>8.2f} {peak / 2 ** 20:>9.1f}"
+    )
+
+
+def camera_benchmarks(args, url, client_options):
+    # solids.camera needs the KML and tile dependencies
+    from solids.camera import terrain_tile
+
+    random.seed(0)
+    depicts = [f"Q{random.randint(1, 200)}" for _ in range(args.lookups)]
+    with tempfile.TemporaryDirectory() as folder:
+        # one query per entity, as before batching, then batched cold and warm
+        for name, chunk_size in [("coordinates each", 1), ("coordinates batch", 200)]:
+            cache = CoordinateCache(os.path.join(folder, name), chunk_size=chunk_size)
+            client = StubClient(url, **client_options)
+            measure(name, client, lambda: cache.resolve(depicts, client))
+        client = StubClient(url, **client_options)
+        measure("coordinates warm", client, lambda: cache.resolve(depicts, client))
+
+    client = StubClient(url, **client_options)
+    measure("terrain tiles", client, lambda: [terrain_tile(client) for _ in range(args.tiles)])
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--jitter", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--max-page", type=int, default=None, help="Portals page cap")
+    parser.add_argument("--omeka", type=int, default=5000, help="Omeka items")
+    parser.add_argument("--portals", type=int, default=110000, help="Portals items")
+    parser.add_argument("--wikidata", type=int, default=5000, help="Wikidata items")
+    parser.add_argument("--lookups", type=int, default=500, help="depicted Q-ids")
+    parser.add_argument("--tiles", type=int, default=100, help="terrain tiles")
+    parser.add_argument("--rate", type=float, default=0, help="requests/s, 0 for no limit")
+    parser.add_argument("--workers", type=int, default=4, help="Omeka threads")
+    parser.add_argument("--per-page", type=int, default=250, help="Omeka page size")
+    parser.add_argument("--page-size", type=int, default=2000, help="Wikidata page size")
+    parser.add_argument("--skip-camera", action="store_true")
+    args = parser.parse_args()
+
+    stub = dict(
+        omeka_items=args.omeka,
+        portals_items=args.portals,
+        wikidata_items=args.wikidata,
+        latency=args.latency,
+        jitter=args.jitter,
+        error_rate=args.error_rate,
+        max_page=args.max_page,
+    )
+    client_options = dict(rate=args.rate, burst=args.workers, backoff=0)
+
+    print(f"{'client':<18} {'requests':>8} {'retries':>8} {'req/s':>8} {'seconds':>8} {'peak MiB':>9}")
+    with serve_in_process(**stub) as url:
+        client = HttpClient(**client_options)
+        measure(
+            "query_omeka",
+            client,
+            lambda: harvest_omeka(
+                client, url + "/api/items", per_page=args.per_page, workers=args.workers
+            ),
+        )
+
+        client = HttpClient(**client_options)
+        measure("query_portals", client, lambda: harvest_portals(client, url + "/portals"))
+
+        client = HttpClient(**client_options)
+        measure(
+            "query_wikidata",
+            client,
+            lambda: harvest_wikidata(client, url + "/sparql", page_size=args.page_size),
+        )
+
+        if not args.skip_camera:
+            camera_benchmarks(args, url, client_options)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+"""Compare the memoized date engine with the per-cell to_datetime path.
+
+python -m benchmarks.dates_accuracy --rows 100000
+"""
+import argparse
+import random
+from time import perf_counter
+
+import pandas as pd
+
+from solids.cumulus import classify_dates, parse_date, parse_dates
+
+
+def sample_dates(rows, distinct=3000, seed=0):
+    random.seed(seed)
+    pool = []
+    for _ in range(distinct):
+        year = random.randint(1840, 1960)
+        kind = random.random()
+        if kind < 0.4:
+            pool.append(str(year))
+        elif kind < 0.6:
+            pool.append(f"{random.randint(1, 12):02d}/{year}")
+        elif kind < 0.85:
+            pool.append(f"{random.randint(1, 28):02d}/{random.randint(1, 12):02d}/{year}")
+        else:
+            pool.append(f"c. {year}")
+    return pd.DataFrame(
+        {
+            "date": random.choices(pool, k=rows),
+            "first_year": random.choices(pool[:500] + ["None"], k=rows),
+            "last_year": random.choices(pool[500:1000] + ["None"], k=rows),
+        }
+    )
+
+
+def current_path(df):
+    df = df.copy()
+    circa = df["date"].str.contains(r"[a-z]", na=False)
+    year = df["date"].str.count(r"[\/-]") == 0
+    month = df["date"].str.count(r"[\/-]") == 1
+    day = df["date"].str.count(r"[\/-]") == 2
+
+    df.loc[year, "date_accuracy"] = "year"
+    df.loc[month, "date_accuracy"] = "month"
+    df.loc[day, "date_accuracy"] = "day"
+    df.loc[circa, "date_accuracy"] = "circa"
+
+    df["date"] = df["date"].str.extract(r"([\d\/-]*\d{4}[-\/\d]*)")
+    df["first_year"] = df["first_year"].str.extract(r"([\d\/-]*\d{4}[-\/\d]*)")
+    df["last_year"] = df["last_year"].str.extract(r"([\d\/-]*\d{4}[-\/\d]*)")
+    df[["first_year", "last_year"]] = df[["first_year", "last_year"]].astype("str")
+    df[["date", "first_year", "last_year"]] = df[
+        ["date", "first_year", "last_year"]
+    ].applymap(lambda x: pd.to_datetime(x, errors="coerce", yearfirst=True))
+    return df
+
+
+def engine_path(df):
+    df = df.copy()
+    df["date_accuracy"] = classify_dates(df["date"])
+    df["date"] = parse_dates(df["date"])
+    df["first_year"] = parse_dates(df["first_year"])
+    df["last_year"] = parse_dates(df["last_year"])
+    return df
+
+
+def timed(function, df):
+    start = perf_counter()
+    result = function(df)
+    return perf_counter() - start, result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=100000)
+    args = parser.parse_args()
+
+    df = sample_dates(args.rows)
+    current, expected = timed(current_path, df)
+    parse_date.cache_clear()
+    cold, result = timed(engine_path, df)
+    warm, _ = timed(engine_path, df)
+
+    # DD/MM/YYYY dates with a day up to 12 used to be read month first; the
+    # engine reads them day first on purpose, so count those apart
+    swapped = 0
+    mismatches = 0
+    for column in ["date", "first_year", "last_year"]:
+        a = pd.to_datetime(expected[column])
+        b = result[column]
+        differ = ~((a == b) | (a.isna() & b.isna()))
+        day_first = (
+            (a.dt.year == b.dt.year) & (a.dt.month == b.dt.day) & (a.dt.day == b.dt.month)
+        )
+        swapped += int((differ & day_first).sum())
+        mismatches += int((differ & ~day_first).sum())
+    mismatches += int((expected["date_accuracy"] != result["date_accuracy"]).sum())
+
+    print(f"rows: {args.rows}")
+    print(f"current (applymap to_datetime): {current:.3f}s")
+    print(f"engine, cold cache:             {cold:.3f}s ({current / cold:.0f}x)")
+    print(f"engine, warm cache:             {warm:.3f}s ({current / warm:.0f}x)")
+    print(f"ambiguous dates now day first:  {swapped}")
+    print(f"other mismatching cells:        {mismatches}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,289 @@
+"""Local stand-ins for the Omeka, Portals, Wikidata and Mapbox APIs.
+
+Responses are synthetic, or replayed from recorded JSON (a list of Omeka
+items, a list of Portals items). Every response waits `latency` seconds
+(plus up to `jitter`), a share of them fail with 503 and Retry-After: 0,
+and Portals pages are capped at `max_page` items whatever the client asks
+for.
+
+    with StubServer(omeka_items=5000, latency=0.05) as server:
+        harvest_omeka(client, server.url + "/api/items")
+"""
+import csv
+import io
+import json
+import multiprocessing
+import random
+import re
+import socketserver
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from urllib.parse import parse_qs, urlparse
+
+WIKIDATA_COLUMNS = [
+    "id",
+    "wikidata_id",
+    "wikidata_ims_id",
+    "wikidata_image",
+    "depict",
+    "depictLabel",
+]
+ENTITY = "http://www.wikidata.org/entity/"
+
+
+def synthetic_omeka(count, seed=0):
+    random.seed(seed)
+    items = []
+    for i in range(count):
+        modified = f"2022-{1 + random.randrange(12):02d}-01T00:00:00+00:00"
+        items.append(
+            {
+                "@id": f"https://images.imaginerio.org/api/items/{i}",
+                "dcterms:identifier": [{"@value": f"{i:07d}"}],
+                "o:created": {"@value": f"2021-{1 + i % 12:02d}-01T00:00:00+00:00"},
+                "o:modified": {"@value": modified} if i % 3 else None,
+            }
+        )
+    return items
+
+
+def synthetic_portals(count):
+    return [
+        {"id": i + 1, "RecordName": f"{i:07d}.jpg", "Title": "", "Date": ""}
+        for i in range(count)
+    ]
+
+
+def synthetic_wikidata(count, landmarks=200, seed=0):
+    random.seed(seed)
+    rows = []
+    for i in range(count):
+        item = f"{ENTITY}Q{1000000 + i}"
+        for depict in random.sample(range(landmarks), random.randint(0, 3)) or [None]:
+            rows.append(
+                {
+                    "id": f"{i:07d}",
+                    "wikidata_id": item,
+                    "wikidata_ims_id": None,
+                    "wikidata_image": None,
+                    "depict": None if depict is None else f"{ENTITY}Q{depict + 1}",
+                    "depictLabel": None if depict is None else f"landmark {depict}",
+                }
+            )
+    return rows
+
+
+class ThreadingHTTPServer(socketserver.ThreadingMixIn, HTTPServer):
+    # http.server has its own only from Python 3.7
+    daemon_threads = True
+
+
+def terrain_png():
+    from PIL import Image
+
+    image = Image.new("RGBA", (256, 256), (1, 134, 160, 255))
+    buffer = io.BytesIO()
+    image.save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+class StubServer:
+    def __init__(
+        self,
+        omeka_items=2000,
+        portals_items=20000,
+        wikidata_items=2000,
+        latency=0.05,
+        jitter=0.0,
+        error_rate=0.0,
+        max_page=None,
+        seed=0,
+    ):
+        if not isinstance(omeka_items, list):
+            omeka_items = synthetic_omeka(omeka_items, seed)
+        if not isinstance(portals_items, list):
+            portals_items = synthetic_portals(portals_items)
+        self.omeka = omeka_items
+        self.portals = portals_items
+        self.wikidata = synthetic_wikidata(wikidata_items, seed=seed)
+        self.items = sorted({row["wikidata_id"] for row in self.wikidata})
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.max_page = max_page
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.png = None
+
+    @classmethod
+    def replay(cls, omeka=None, portals=None, **kwargs):
+        """A server answering with recorded Omeka and Portals items."""
+        for key, path in (("omeka_items", omeka), ("portals_items", portals)):
+            if path:
+                with open(path) as f:
+                    kwargs[key] = json.load(f)
+        return cls(**kwargs)
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def start(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            # headers and body go out in separate writes
+            disable_nagle_algorithm = True
+
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                stub.handle(self, "GET")
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                stub.handle(self, "POST", self.rfile.read(length).decode("utf-8"))
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_port}"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def handle(self, request, method, form=""):
+        with self.lock:
+            self.requests += 1
+            failed = self.random.random() < self.error_rate
+            delay = self.latency + self.random.random() * self.jitter
+        time.sleep(delay)
+        if failed:
+            return self.send(request, 503, b"", headers={"Retry-After": "0"})
+
+        url = urlparse(request.path)
+        query = {key: values[0] for key, values in parse_qs(url.query).items()}
+        query.update((key, values[0]) for key, values in parse_qs(form).items())
+        if url.path.startswith("/api/items"):
+            return self.omeka_page(request, query)
+        if url.path.startswith("/portals"):
+            return self.portals_page(request, query)
+        if url.path.startswith("/sparql"):
+            return self.sparql(request, query)
+        if url.path.endswith(".pngraw"):
+            if self.png is None:
+                self.png = terrain_png()
+            return self.send(request, 200, self.png, "image/png")
+        return self.send(request, 404, b"")
+
+    def omeka_page(self, request, query):
+        items = self.omeka
+        if "sort_by" in query:
+            field = "o:" + query["sort_by"]
+            items = sorted(
+                items,
+                key=lambda item: (item.get(field) or {}).get("@value", ""),
+                reverse=query.get("sort_order") == "desc",
+            )
+        size = int(query.get("per_page", 25))
+        start = (int(query.get("page", 1)) - 1) * size
+        body = json.dumps(items[start : start + size]).encode("utf-8")
+        headers = {"Omeka-S-Total-Results": str(len(items))}
+        return self.send(request, 200, body, "application/json", headers)
+
+    def portals_page(self, request, query):
+        size = int(query.get("maxreturned", 100))
+        if self.max_page:
+            size = min(size, self.max_page)
+        start = int(query.get("startindex", 0))
+        body = {
+            "totalcount": len(self.portals),
+            "items": self.portals[start : start + size],
+        }
+        return self.send(
+            request, 200, json.dumps(body).encode("utf-8"), "application/json"
+        )
+
+    def sparql(self, request, query):
+        text = query.get("query", "")
+        if "Q71989864" in text:
+            return self.collection(request, text)
+
+        # coordinate lookups, for one entity or a VALUES list of them
+        bindings = []
+        for q in sorted(set(re.findall(r"wd:(Q\d+)", text))):
+            number = int(q[1:])
+            lng = -43.2 + (number % 100) / 1000
+            lat = -22.9 - (number % 37) / 1000
+            bindings.append(
+                {
+                    "item": {"type": "uri", "value": ENTITY + q},
+                    "coordinate": {"type": "literal", "value": f"Point({lng} {lat})"},
+                }
+            )
+        body = {
+            "head": {"vars": ["item", "coordinate"]},
+            "results": {"bindings": bindings},
+        }
+        content_type = "application/sparql-results+json"
+        return self.send(request, 200, json.dumps(body).encode("utf-8"), content_type)
+
+    def collection(self, request, text):
+        after = re.search(r'STR\(\?item\) > "(.*?)"', text)
+        limit = re.search(r"LIMIT (\d+)", text)
+        items = [item for item in self.items if not after or item > after.group(1)]
+        if limit:
+            items = items[: int(limit.group(1))]
+        selected = set(items)
+
+        out = io.StringIO()
+        writer = csv.writer(out)
+        writer.writerow(WIKIDATA_COLUMNS)
+        for row in self.wikidata:
+            if row["wikidata_id"] in selected:
+                writer.writerow([row[column] or "" for column in WIKIDATA_COLUMNS])
+        return self.send(request, 200, out.getvalue().encode("utf-8"), "text/csv")
+
+    def send(self, request, status, body, content_type="text/plain", headers=None):
+        request.send_response(status)
+        request.send_header("Content-Type", content_type)
+        request.send_header("Content-Length", str(len(body)))
+        for key, value in (headers or {}).items():
+            request.send_header(key, value)
+        request.end_headers()
+        request.wfile.write(body)
+
+
+def _serve(connection, kwargs):
+    with StubServer(**kwargs) as server:
+        connection.send(server.url)
+        connection.recv()
+        connection.send(server.requests)
+
+
+class serve_in_process:
+    """Run a StubServer in a child process, so it stays out of the timings
+    and memory of the code under test. Yields the server url."""
+
+    def __init__(self, **kwargs):
+        self.kwargs = kwargs
+
+    def __enter__(self):
+        self.connection, child = multiprocessing.Pipe()
+        self.process = multiprocessing.Process(
+            target=_serve, args=(child, self.kwargs), daemon=True
+        )
+        self.process.start()
+        return self.connection.recv()
+
+    def __exit__(self, *exc):
+        self.connection.send("stop")
+        self.requests = self.connection.recv()
+        self.process.join()
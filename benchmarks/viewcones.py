@@ -0,0 +1,102 @@
+"""Compare the vectorized view cones with the per-vertex reproject path.
+
+python -m benchmarks.viewcones --cameras 2000
+"""
+import argparse
+import math
+import random
+from time import perf_counter
+
+import numpy as np
+from pyproj import Proj
+from shapely.geometry import Point, Polygon
+
+from solids.viewcone import draw_cones
+
+
+def sample_cameras(count, seed=0):
+    random.seed(seed)
+    cameras = []
+    for _ in range(count):
+        fov = random.uniform(10, 60)
+        cameras.append(
+            [
+                -43.2 + random.uniform(-0.1, 0.1),
+                -22.9 + random.uniform(-0.1, 0.1),
+                random.uniform(0, 360),
+                -fov / 2,
+                fov / 2,
+                random.uniform(400, 3000),
+            ]
+        )
+    return cameras
+
+
+def reproject(coordinates, inverse=False):
+    rj = Proj("EPSG:32722")
+    origin = Point(coordinates)
+    origin_proj = rj(origin.x, origin.y, inverse=inverse)
+
+    return Point(origin_proj)
+
+
+def current_cone(lng, lat, heading, left_fov, right_fov, radius, steps=200):
+    center = Point(reproject((lng, lat)))
+    start_angle = heading - right_fov
+    end_angle = heading - left_fov
+
+    def polar_point(origin_point, angle, distance):
+        return [
+            origin_point.x + math.sin(math.radians(angle)) * distance,
+            origin_point.y + math.cos(math.radians(angle)) * distance,
+        ]
+
+    if start_angle > end_angle:
+        start_angle = start_angle - 360
+    step_angle_width = (end_angle - start_angle) / steps
+    sector_width = end_angle - start_angle
+    segment_vertices = [reproject(polar_point(center, 0, 0), inverse=True)]
+    segment_vertices.append(
+        reproject(polar_point(center, start_angle, radius), inverse=True)
+    )
+    for z in range(1, steps):
+        segment_vertices.append(
+            reproject(
+                polar_point(center, start_angle + z * step_angle_width, radius),
+                inverse=True,
+            )
+        )
+    segment_vertices.append(
+        reproject(polar_point(center, start_angle + sector_width, radius), inverse=True)
+    )
+    segment_vertices.append(reproject(polar_point(center, 0, 0), inverse=True))
+    return Polygon(segment_vertices)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--cameras", type=int, default=2000)
+    args = parser.parse_args()
+
+    cameras = sample_cameras(args.cameras)
+
+    start = perf_counter()
+    expected = [current_cone(*camera) for camera in cameras]
+    current = perf_counter() - start
+
+    start = perf_counter()
+    result = draw_cones(*np.array(cameras).T)
+    vectorized = perf_counter() - start
+
+    deviation = max(
+        np.abs(np.array(a.exterior.coords) - np.array(b.exterior.coords)).max()
+        for a, b in zip(expected, result)
+    )
+    print(f"cameras: {len(cameras)}")
+    print(f"current (per-vertex Proj): {current:.3f}s")
+    print(f"vectorized:                {vectorized:.3f}s ({current / vectorized:.0f}x)")
+    print(f"largest vertex difference: {deviation:.2e} degrees")
+
+
+if __name__ == "__main__":
+    main()
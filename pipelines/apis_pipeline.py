@@ -9,20 +9,66 @@ from solids.apis import (
     query_omeka,
     query_portals,
     query_wikidata,
+    save_harvests,
     wikidata_dataframe,
 )
-from solids.utils import df_csv_io_manager, root_input_csv, update_metadata
+from solids.utils import (
+    df_csv_io_manager,
+    http_cache,
+    http_client,
+    metadata_store,
+    root_input_csv,
+    update_metadata_batch,
+)
 
 load_dotenv(override=True)
 
 preset = {
     "solids": {
-        "query_omeka": {"config": {"env": "OMEKA_API"}},
-        "query_wikidata": {"config": {"env": "WIKIDATA_API"}},
-        "query_portals": {"config": {"env": "PORTALS_API"}},
+        "query_omeka": {
+            "config": {
+                "endpoint": {"env": "OMEKA_API"},
+                "cursor": {"env": "OMEKA_CURSOR"},
+            }
+        },
+        "query_wikidata": {
+            "config": {
+                "endpoint": {"env": "WIKIDATA_API"},
+                "checkpoint": {"env": "WIKIDATA_CHECKPOINT"},
+            }
+        },
+        "query_portals": {"config": {"endpoint": {"env": "PORTALS_API"}}},
         "portals_dataframe": {"config": {"env": "PORTALS_PREFIX"}},
     },
-    "resources": {"metadata_root": {"config": {"env": "METADATA"}}},
+    "resources": {
+        "metadata_root": {"config": {"env": "METADATA"}},
+        "http_cache": {"config": {"path": {"env": "HTTP_CACHE"}}},
+        "metadata_store": {
+            "config": {"path": {"env": "METADATA_DB"}, "seed": {"env": "METADATA"}}
+        },
+    },
+}
+
+incremental_preset = {
+    **preset,
+    "solids": {
+        **preset["solids"],
+        "query_omeka": {
+            "config": {
+                "endpoint": {"env": "OMEKA_API"},
+                "cursor": {"env": "OMEKA_CURSOR"},
+                "incremental": True,
+            }
+        },
+    },
+}
+
+# the three harvests are independent: run them side by side, each step in
+# its own process, with outputs handed over through the filesystem (this
+# needs a persistent instance, i.e. DAGSTER_HOME set)
+concurrent_preset = {
+    **preset,
+    "execution": {"multiprocess": {"config": {"max_concurrent": 3}}},
 }
 
 
@@ -36,30 +82,58 @@ preset = {
             resource_defs={
                 "pandas_csv": df_csv_io_manager,
                 "metadata_root": root_input_csv,
+                "http_cache": http_cache,
+                "http_client": http_client,
+                "metadata_store": metadata_store,
             },
-        )
+        ),
+        dg.ModeDefinition(
+            name="concurrent",
+            resource_defs={
+                "io_manager": dg.fs_io_manager,
+                "pandas_csv": df_csv_io_manager,
+                "metadata_root": root_input_csv,
+                "http_cache": http_cache,
+                "http_client": http_client,
+                "metadata_store": metadata_store,
+            },
+            executor_defs=[dg.multiprocess_executor],
+        ),
     ],
     preset_defs=[
         dg.PresetDefinition(
             "default",
             run_config=preset,
             mode="default",
-        )
+        ),
+        dg.PresetDefinition(
+            "incremental",
+            run_config=incremental_preset,
+            mode="default",
+        ),
+        dg.PresetDefinition(
+            "concurrent",
+            run_config=concurrent_preset,
+            mode="concurrent",
+        ),
     ],
 )
 def apis_pipeline():
 
     omeka_results = query_omeka()
-    omeka_df = omeka_dataframe(omeka_results)
-    update_metadata(df=omeka_df)
+    omeka_df, omeka_harvest = omeka_dataframe(omeka_results)
 
     wikidata_results = query_wikidata()
-    wikidata_df = wikidata_dataframe(wikidata_results)
-    update_metadata(df=wikidata_df)
+    wikidata_df, wikidata_harvest = wikidata_dataframe(wikidata_results)
 
     portals_results = query_portals()
-    portals_df = portals_dataframe(portals_results)
-    update_metadata(df=portals_df)
+    portals_df, portals_harvest = portals_dataframe(portals_results)
+
+    # sources with nothing new yield no frame and drop out of the fan-in
+    metadata = update_metadata_batch(dfs=[omeka_df, wikidata_df, portals_df])
+    save_harvests(
+        harvests=[omeka_harvest, wikidata_harvest, portals_harvest], metadata=metadata
+    )
 
 
 ################   SENSORS   ##################
@@ -15,7 +15,14 @@ preset = {
         "move_files": {"config": {"env": "PROCESSED_SINGLE"}},
         "create_geojson": {"config": {"env": "CAMERA"}},
     },
-    "resources": {"metadata_root": {"config": {"env": "METADATA"}}},
+    "resources": {
+        "metadata_root": {"config": {"env": "METADATA"}},
+        "metadata_index": {"config": {"env": "METADATA"}},
+        "metadata_store": {
+            "config": {"path": {"env": "METADATA_DB"}, "seed": {"env": "METADATA"}}
+        },
+        "coordinate_cache": {"config": {"path": {"env": "COORDINATE_CACHE"}}},
+    },
 }
 
 
@@ -26,6 +33,10 @@ preset = {
                 "geojson": geojson_io_manager,
                 "pandas_csv": df_csv_io_manager,
                 "metadata_root": root_input_csv,
+                "metadata_index": metadata_index,
+                "metadata_store": metadata_store,
+                "http_client": http_client,
+                "coordinate_cache": coordinate_cache,
             }
         )
     ],
@@ -9,13 +9,49 @@ load_dotenv(override=True)
 
 
 preset = {
+    "solids": {
+        "xml_to_df": {"config": {"cache": {"env": "CUMULUS_CACHE"}}},
+        "select_changes": {
+            "config": {"fingerprints": {"env": "CUMULUS_FINGERPRINTS"}}
+        },
+        "merge_cumulus": {"config": {"env": "CUMULUS"}},
+    },
     "resources": {
         "metadata_root": {"config": {"env": "METADATA"}},
+        "metadata_store": {
+            "config": {"path": {"env": "METADATA_DB"}, "seed": {"env": "METADATA"}}
+        },
         "xml_root": {"config": {"env": "CUMULUS_XML"}},
         # "current_df_root": {"config": {"env": "CUMULUS"}},
     }
 }
 
+parallel_preset = {
+    **preset,
+    "solids": {
+        **preset["solids"],
+        "xml_to_df": {
+            "config": {
+                "cache": {"env": "CUMULUS_CACHE"},
+                "workers": os.cpu_count() or 1,
+            }
+        },
+    },
+}
+
+incremental_preset = {
+    **preset,
+    "solids": {
+        **preset["solids"],
+        "select_changes": {
+            "config": {
+                "fingerprints": {"env": "CUMULUS_FINGERPRINTS"},
+                "incremental": True,
+            }
+        },
+    },
+}
+
 
 @dg.pipeline(
     mode_defs=[
@@ -24,26 +60,54 @@ preset = {
             resource_defs={
                 "pandas_csv": df_csv_io_manager,
                 "metadata_root": root_input_csv,
-                "xml_root": root_input_xml,
+                "metadata_store": metadata_store,
+                "xml_root": root_input_path,
                 # "current_df_root": root_input_csv,
             },
-        )
+        ),
+        dg.ModeDefinition(
+            name="parquet",
+            resource_defs={
+                "pandas_csv": df_parquet_io_manager,
+                "metadata_root": root_input_parquet,
+                "metadata_store": metadata_store,
+                "xml_root": root_input_path,
+            },
+        ),
     ],
     preset_defs=[
         dg.PresetDefinition(
             "default",
             run_config=preset,
             mode="default",
-        )
+        ),
+        dg.PresetDefinition(
+            "parallel",
+            run_config=parallel_preset,
+            mode="default",
+        ),
+        dg.PresetDefinition(
+            "incremental",
+            run_config=incremental_preset,
+            mode="default",
+        ),
+        dg.PresetDefinition(
+            "parquet",
+            run_config=preset,
+            mode="parquet",
+        ),
     ],
 )
 def cumulus_pipeline():
     cumulus_df = xml_to_df()
+    cumulus_df, changes = select_changes(cumulus_df)
     cumulus_df = organize_columns(cumulus_df)
     cumulus_df = extract_dimensions(cumulus_df)
-    listed_creators = creators_list(cumulus_df)
     cumulus_df = dates_accuracy(cumulus_df)
-    update_metadata(df=cumulus_df)
+    cumulus = merge_cumulus(cumulus_df, changes)
+    listed_creators = creators_list(cumulus)
+    metadata = update_metadata(df=cumulus_df)
+    save_fingerprints(changes, cumulus=cumulus, metadata=metadata)
 
 
 ################   SENSORS   ##################
@@ -58,7 +122,7 @@ def trigger_cumulus(context):
 
     if file_mtime <= last_mtime:
         run_key = f"cumulus.xml:{str(file_mtime)}"
-        yield dg.RunRequest(run_key=run_key, run_config=preset)
+        yield dg.RunRequest(run_key=run_key, run_config=incremental_preset)
 
         max_mtime = max(max_mtime, file_mtime)
         context.update_cursor(str(max_mtime))
@@ -1,7 +1,13 @@
 import dagster as dg
 from dotenv import load_dotenv
 from solids.export import *
-from solids.utils import df_csv_io_manager, geojson_io_manager, root_input_csv
+from solids.utils import (
+    df_csv_io_manager,
+    df_parquet_io_manager,
+    geojson_io_manager,
+    root_input_csv,
+    root_input_parquet,
+)
 
 load_dotenv(override=True)
 
@@ -28,14 +34,28 @@ preset = {
                 "metadata_root": root_input_csv,
                 "smapshot_root": root_input_csv,
             },
-        )
+        ),
+        dg.ModeDefinition(
+            name="parquet",
+            resource_defs={
+                "pandas_csv": df_parquet_io_manager,
+                "jstor_root": root_input_csv,
+                "metadata_root": root_input_parquet,
+                "smapshot_root": root_input_parquet,
+            },
+        ),
     ],
     preset_defs=[
         dg.PresetDefinition(
             "default",
             run_config=preset,
             mode="default",
-        )
+        ),
+        dg.PresetDefinition(
+            "parquet",
+            run_config=preset,
+            mode="parquet",
+        ),
     ],
 )
 def export_pipeline():
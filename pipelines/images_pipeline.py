@@ -1,7 +1,14 @@
 import dagster as dg
 from dotenv import load_dotenv
 from solids.images import *
-from solids.utils import df_csv_io_manager, root_input_csv, update_metadata
+from solids.utils import (
+    df_csv_io_manager,
+    metadata_index,
+    metadata_store,
+    root_input_csv,
+    root_input_geojson,
+    update_metadata,
+)
 
 load_dotenv(override=True)
 
@@ -29,6 +36,10 @@ preset = {
     },
     "resources": {
         "metadata_root": {"config": {"env": "METADATA"}},
+        "metadata_index": {"config": {"env": "METADATA"}},
+        "metadata_store": {
+            "config": {"path": {"env": "METADATA_DB"}, "seed": {"env": "METADATA"}}
+        },
         "camera_root": {"config": {"env": "CAMERA"}},
     },
 }
@@ -40,7 +51,9 @@ preset = {
             resource_defs={
                 "pandas_csv": df_csv_io_manager,
                 "metadata_root": root_input_csv,
-                "camera_root": root_input_csv,
+                "camera_root": root_input_geojson,
+                "metadata_index": metadata_index,
+                "metadata_store": metadata_store,
             }
         )
     ]
@@ -15,6 +15,9 @@ preset = {
         "portals_root": {"config": {"env": "PORTALS"}},
         "camera_root": {"config": {"env": "CAMERA"}},
         "images_root": {"config": {"env": "IMAGES"}},
+        "metadata_store": {
+            "config": {"path": {"env": "METADATA_DB"}, "seed": {"env": "METADATA"}}
+        },
     },
 }
 
@@ -30,9 +33,14 @@ preset = {
         dg.InputDefinition("camera", root_manager_key="camera_root"),
         dg.InputDefinition("images", root_manager_key="images_root"),
     ],
-    output_defs=[dg.OutputDefinition(io_manager_key="pandas_csv", name="metadata")],
+    output_defs=[dg.OutputDefinition(dg.Nothing, name="metadata")],
+    required_resource_keys={"metadata_store"},
 )
 def create_metadata(context, omeka, cumulus, wikidata, portals, camera, images):
+    store = context.resources.metadata_store
+    # rows written by other pipelines during the rebuild must not be lost
+    versions = store.read(columns=[], versions=True)["_version"]
+
     camera_new = camera[
         [
             "id",
@@ -99,7 +107,10 @@ def create_metadata(context, omeka, cumulus, wikidata, portals, camera, images):
     # print("METADATA:", metadata["first_year"][10], type(cumulus["first_year"][10]))
     metadata.name = "metadata"
     # metadata_new.set_index("id", inplace=True)
-    return metadata_new.set_index("id")
+    metadata_new = metadata_new.set_index("id")
+    store.replace(metadata_new, versions=versions)
+    yield from export_metadata(context)
+    yield dg.Output(None, "metadata")
 
 
 ################   PIPELINE   ##################
@@ -118,15 +129,34 @@ def create_metadata(context, omeka, cumulus, wikidata, portals, camera, images):
                 "portals_root": root_input_csv,
                 "camera_root": root_input_geojson,
                 "images_root": root_input_csv,
+                "metadata_store": metadata_store,
             },
-        )
+        ),
+        dg.ModeDefinition(
+            name="parquet",
+            resource_defs={
+                "pandas_csv": df_parquet_io_manager,
+                "cumulus_root": root_input_parquet,
+                "omeka_root": root_input_parquet,
+                "wikidata_root": root_input_parquet,
+                "portals_root": root_input_parquet,
+                "camera_root": root_input_geojson,
+                "images_root": root_input_parquet,
+                "metadata_store": metadata_store,
+            },
+        ),
     ],
     preset_defs=[
         dg.PresetDefinition(
             "default",
             run_config=preset,
             mode="default",
-        )
+        ),
+        dg.PresetDefinition(
+            "parquet",
+            run_config=preset,
+            mode="parquet",
+        ),
     ],
 )
 def metadata_pipeline():
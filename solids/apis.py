@@ -1,65 +1,264 @@
+import csv
+import hashlib
+import io
+import json
+import os
 import urllib
-from time import sleep
+from concurrent.futures import ThreadPoolExecutor
+from time import monotonic
 
 import dagster as dg
+import numpy as np
 import pandas as pd
 import requests
-from requests.adapters import HTTPAdapter
-from urllib3.util import Retry
 
 
-# OMEKA
-@dg.solid(config_schema=dg.StringSource)
-def query_omeka(context):
-    endpoint = context.solid_config
-    print(endpoint)
-
-    # start session
-    retry_strategy = Retry(
-        total=3,
-        status_forcelist=[429, 500, 502, 503, 504],
-        method_whitelist=["HEAD", "GET", "OPTIONS"],
-    )
-    adapter = HTTPAdapter(max_retries=retry_strategy)
-    http = requests.Session()
-    http.mount("https://", adapter)
-    http.mount("http://", adapter)
+def results_fingerprint(results):
+    if isinstance(results, pd.DataFrame):
+        hashed = pd.util.hash_pandas_object(results, index=True).values
+        return hashlib.sha256(
+            hashed.tobytes() + str(list(results.columns)).encode("utf-8")
+        ).hexdigest()
+    text = json.dumps(results, sort_keys=True, default=str)
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def pending_harvest(context, name, results, cursor=None):
+    """What to record once the output of name is written, or None when results
+    match the last run and its csv output still exists."""
+    fingerprint = results_fingerprint(results)
+    seen = context.resources.http_cache.seen(name, fingerprint)
+    if seen and os.path.exists(os.path.join("data", "output", name + ".csv")):
+        context.log.info(f"{name.upper()} is unchanged upstream, skipping")
+        if cursor is not None:
+            # the csv already holds these results
+            write_cursor(cursor)
+        return None
+    return {"name": name, "fingerprint": fingerprint, "cursor": cursor}
+
+
+def write_cursor(cursor):
+    os.makedirs(os.path.dirname(cursor["path"]) or ".", exist_ok=True)
+    with open(cursor["path"], "w") as f:
+        json.dump(cursor["state"], f, indent=2)
+
+
+def save_harvest(cache, harvest):
+    cache.record(harvest["name"], harvest["fingerprint"])
+    if harvest.get("cursor") is not None:
+        write_cursor(harvest["cursor"])
 
-    response = http.get(endpoint, params={"per_page": 1})
 
-    # loop over pages until response is blank
-    results = {}
-    l1 = []
-    l2 = []
-    page = 1
-    while response != []:
-        response = http.get(endpoint, params={"page": page, "per_page": 250}).json()
-
-        for item in response:
-            try:
-                l1.append(item["dcterms:identifier"][0]["@value"])
-                l2.append(item["@id"])
-            except:
-                pass
+@dg.solid(
+    input_defs=[
+        dg.InputDefinition("harvests", dg.List[dg.Any]),
+        dg.InputDefinition("metadata", dg.Nothing),
+    ],
+    required_resource_keys={"http_cache"},
+)
+def save_harvests(context, harvests):
+    """Record the harvests and cursors once their csvs and the metadata are written, so a
+    failed write is harvested again on the next run."""
+    for harvest in harvests:
+        save_harvest(context.resources.http_cache, harvest)
+
+
+# OMEKA
+def omeka_page(http, endpoint, params):
+    response = http.get(endpoint, params=params)
+    response.raise_for_status()
+    return response.json()
+
+
+def omeka_timestamp(item, field):
+    value = (item.get(f"o:{field}") or {}).get("@value")
+    return pd.Timestamp(value) if value else None
+
+
+def omeka_records(data):
+    """(identifier, url, last change) for each item; identifier may be None."""
+    records = []
+    for item in data:
+        try:
+            identifier = item["dcterms:identifier"][0]["@value"]
+        except (KeyError, IndexError, TypeError):
+            identifier = None
+        stamps = [omeka_timestamp(item, field) for field in ("created", "modified")]
+        stamps = [stamp for stamp in stamps if stamp is not None]
+        records.append((identifier, item["@id"], max(stamps) if stamps else None))
+    return records
+
+
+def harvest_omeka(http, endpoint, per_page=250, workers=4):
+    """Records of all items of an Omeka S endpoint, in page order.
+
+    The page count comes from the Omeka-S-Total-Results header; those pages
+    are fetched by up to `workers` threads, within the client's rate limit
+    for the host. Pages past the count (items added meanwhile, or a server
+    without the header) are then read one by one until an empty page.
+    """
+    response = http.get(endpoint, params={"per_page": 1})
+    response.raise_for_status()
+    total = int(response.headers.get("Omeka-S-Total-Results", 0))
+    pages = -(-total // per_page)
+
+    def fetch(page):
+        params = {"page": page, "per_page": per_page}
+        return omeka_page(http, endpoint, params)
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        results = list(pool.map(fetch, range(1, pages + 1)))
+
+    page = pages + 1
+    while True:
+        data = fetch(page)
+        if not data:
+            break
+        results.append(data)
         page += 1
-        sleep(0.5)
 
-    results.update({"id": l1, "omeka_url": l2})
+    return [record for data in results for record in omeka_records(data)]
+
+
+def harvest_omeka_since(http, endpoint, since, per_page=250):
+    """Records of the items created or modified at or after since.
+
+    Items are read newest first, sorted by creation and then by
+    modification time; each pass stops at the first older item.
+    """
+    records = {}
+    for field in ("created", "modified"):
+        page = 1
+        while True:
+            params = {
+                "page": page,
+                "per_page": per_page,
+                "sort_by": field,
+                "sort_order": "desc",
+            }
+            data = omeka_page(http, endpoint, params)
+            fresh = []
+            for item in data:
+                stamp = omeka_timestamp(item, field)
+                if stamp is None or stamp < since:
+                    break
+                fresh.append(item)
+            for record in omeka_records(fresh):
+                records[record[1]] = record
+            if len(fresh) < len(data) or not data:
+                break
+            page += 1
+    return list(records.values())
+
+
+def read_cursor(path):
+    if path and os.path.exists(path):
+        with open(path) as f:
+            return json.load(f)
+    return None
+
+
+@dg.solid(
+    required_resource_keys={"http_cache", "http_client"},
+    config_schema={
+        "endpoint": dg.StringSource,
+        "per_page": dg.Field(dg.Int, is_required=False, default_value=250),
+        "workers": dg.Field(dg.Int, is_required=False, default_value=4),
+        "incremental": dg.Field(dg.Bool, is_required=False, default_value=False),
+        "cursor": dg.Field(
+            dg.StringSource,
+            is_required=False,
+            description="Where the last harvest's high-water mark is kept",
+        ),
+        "reconcile_days": dg.Field(
+            dg.Int,
+            is_required=False,
+            default_value=7,
+            description="Incremental runs do a full harvest this often, to catch deletions",
+        ),
+    },
+)
+def query_omeka(context):
+    config = context.solid_config
+    endpoint = config["endpoint"]
+    context.log.info(endpoint)
+
+    http = context.resources.http_cache.session(context.resources.http_client)
+    cursor = read_cursor(config.get("cursor"))
+    now = pd.Timestamp.utcnow()
+    full = (
+        not config["incremental"]
+        or cursor is None
+        or "modified" not in cursor
+        or not os.path.exists("data/output/api_omeka.csv")
+        or now - pd.Timestamp(cursor["reconciled"])
+        > pd.Timedelta(days=config["reconcile_days"])
+    )
 
+    if full:
+        records = harvest_omeka(
+            http,
+            endpoint,
+            per_page=config["per_page"],
+            workers=config["workers"],
+        )
+        cursor = {"reconciled": now.isoformat()}
+    else:
+        since = pd.Timestamp(cursor["modified"])
+        records = harvest_omeka_since(
+            http, endpoint, since, per_page=config["per_page"]
+        )
+        context.log.info(f"{len(records)} items changed since {since}")
+        cursor = dict(cursor)
+
+    stamps = [stamp for _, _, stamp in records if stamp is not None]
+    if "modified" in cursor:
+        stamps.append(pd.Timestamp(cursor["modified"]))
+    if stamps:
+        cursor["modified"] = max(stamps).isoformat()
+
+    results = {
+        "id": [identifier for identifier, _, _ in records if identifier is not None],
+        "omeka_url": [url for identifier, url, _ in records if identifier is not None],
+    }
+    if not full:
+        results["updated"] = [url for _, url, _ in records]
+    if config.get("cursor"):
+        results["cursor"] = {"path": config["cursor"], "state": cursor}
     return results
 
 
 @dg.solid(
-    output_defs=[dg.OutputDefinition(io_manager_key="pandas_csv", name="api_omeka")]
+    required_resource_keys={"http_cache"},
+    output_defs=[
+        dg.OutputDefinition(
+            io_manager_key="pandas_csv", name="api_omeka", is_required=False
+        ),
+        dg.OutputDefinition(name="harvest", is_required=False),
+    ],
 )
 def omeka_dataframe(context, results):
     if results == None:
         context.log.info("Couldn't update")
-        return None
+        return
+
+    results = dict(results)
+    cursor = results.pop("cursor", None)
+    harvest = pending_harvest(context, "api_omeka", results, cursor)
+    if harvest is None:
+        return
 
     else:
+        updated = results.pop("updated", None)
+
         # create dataframes
         omeka_df = pd.DataFrame(results)
+        if updated is not None:
+            # incremental harvest: replace the items that changed
+            existing = pd.read_csv("data/output/api_omeka.csv", dtype=str)
+            existing = existing[~existing["omeka_url"].isin(updated)]
+            omeka_df = pd.concat([existing, omeka_df], ignore_index=True)
+
         omeka_duplicated = omeka_df[omeka_df.duplicated(subset="id")]
         if len(omeka_duplicated) > 0:
             omeka_duplicated.to_csv("data/output/duplicated-omeka.csv")
@@ -67,142 +266,321 @@ def omeka_dataframe(context, results):
 
         omeka_df.name = "api_omeka"
 
-        return omeka_df.set_index("id")
+        yield dg.Output(omeka_df.set_index("id"), "api_omeka")
+        yield dg.Output(harvest, "harvest")
 
 
 # WIKIDATA
-@dg.solid(config_schema=dg.StringSource)
-def query_wikidata(context):
-    endpoint = context.solid_config
-
-    query = None
-    if query == None:
-        query = """SELECT DISTINCT (?inventoryNumber as ?id) (?item as ?wikidata_id) (?imsid as ?wikidata_ims_id) (?image as ?wikidata_image) ?depict ?depictLabel
-    WHERE {
-    BIND(wdt:P31 AS ?instanceOf) .
-    ?item wdt:P195* wd:Q71989864 .
+WIKIDATA_COLUMNS = [
+    "id",
+    "wikidata_id",
+    "wikidata_ims_id",
+    "wikidata_image",
+    "depict",
+    "depictLabel",
+]
+
+
+def wikidata_query(after="", limit=0):
+    """The collection query, restricted to the `limit` items after `after`.
+
+    Items are selected in a subquery, so a page always holds every row of
+    its items.
+    """
+    page = f"ORDER BY ?item\n        LIMIT {limit}" if limit else ""
+    return f"""SELECT DISTINCT (?inventoryNumber as ?id) (?item as ?wikidata_id) (?imsid as ?wikidata_ims_id) (?image as ?wikidata_image) ?depict ?depictLabel
+    WHERE {{
+    {{
+        SELECT DISTINCT ?item WHERE {{
+        ?item wdt:P195* wd:Q71989864 .
+        ?item wdt:P217 [] .
+        FILTER(STR(?item) > "{after}")
+        }}
+        {page}
+    }}
     ?item wdt:P217 ?inventoryNumber .
-        
-    OPTIONAL { ?item wdt:P18 ?image . }
-    OPTIONAL { ?item wdt:P180 ?depict . }
-    OPTIONAL { ?item wdt:P7835 ?imsid . }
 
-    SERVICE wikibase:label { bd:serviceParam wikibase:language "pt-br", "en" . }
-
-    }"""
-    try:
-        retry_strategy = Retry(
-            total=3,
-            status_forcelist=[429, 500, 502, 503, 504],
-            method_whitelist=["HEAD", "GET", "OPTIONS"],
+    OPTIONAL {{ ?item wdt:P18 ?image . }}
+    OPTIONAL {{ ?item wdt:P180 ?depict . }}
+    OPTIONAL {{ ?item wdt:P7835 ?imsid . }}
+
+    SERVICE wikibase:label {{ bd:serviceParam wikibase:language "pt-br", "en" . }}
+
+    }}"""
+
+
+def read_sparql_csv(lines, columns):
+    """Append the rows of a SPARQL CSV result to columns, a dict of lists.
+
+    Unbound values come as empty cells and are stored as None.
+    """
+    reader = csv.reader(lines)
+    header = next(reader, None) or []
+    values = [columns.setdefault(name, []) for name in header]
+    for row in reader:
+        for column, value in zip(values, row):
+            column.append(value or None)
+
+
+def harvest_wikidata(http, endpoint, page_size=2000, checkpoint=None):
+    """Rows of the collection query, as a dict of column lists.
+
+    Pages of page_size items (0 for a single query) are read in item order.
+    With a checkpoint, each finished page is appended to that file, and a
+    harvest that failed resumes after its last page; the file is removed
+    once the harvest completes.
+    """
+    columns = {name: [] for name in WIKIDATA_COLUMNS}
+    after = ""
+
+    if checkpoint and os.path.exists(checkpoint):
+        with open(checkpoint) as f:
+            for line in f:
+                try:
+                    page = json.loads(line)
+                except ValueError:
+                    break
+                if page["page_size"] != page_size:
+                    break
+                for name, values in page["columns"].items():
+                    columns.setdefault(name, []).extend(values)
+                after = page["after"]
+
+    while True:
+        page = {name: [] for name in WIKIDATA_COLUMNS}
+        response = http.get(
+            endpoint,
+            params={"query": wikidata_query(after, page_size)},
+            headers={"Accept": "text/csv"},
         )
-        adapter = HTTPAdapter(max_retries=retry_strategy)
-        http = requests.Session()
-        http.mount("https://", adapter)
-        http.mount("http://", adapter)
+        response.raise_for_status()
+        read_sparql_csv(io.StringIO(response.text, newline=""), page)
 
-        response = http.get(endpoint, params={"format": "json", "query": query})
-        data = response.json()
-        return data
+        for name, values in page.items():
+            columns.setdefault(name, []).extend(values)
+        items = set(page["wikidata_id"])
+        if not page_size or len(items) < page_size:
+            break
+        after = max(items)
 
-    except Exception:
-        context.log.info("Couldn't update")
-        return None
+        if checkpoint:
+            os.makedirs(os.path.dirname(checkpoint) or ".", exist_ok=True)
+            with open(checkpoint, "a") as f:
+                record = {"page_size": page_size, "after": after, "columns": page}
+                f.write(json.dumps(record) + "\n")
+
+    if checkpoint and os.path.exists(checkpoint):
+        os.remove(checkpoint)
+    return columns
 
 
 @dg.solid(
-    output_defs=[dg.OutputDefinition(io_manager_key="pandas_csv", name="api_wikidata")]
+    required_resource_keys={"http_cache", "http_client"},
+    config_schema={
+        "endpoint": dg.StringSource,
+        "page_size": dg.Field(
+            dg.Int,
+            is_required=False,
+            default_value=2000,
+            description="Items per query, 0 to ask for everything at once",
+        ),
+        "checkpoint": dg.Field(
+            dg.StringSource,
+            is_required=False,
+            description="File keeping finished pages, to resume a failed harvest",
+        ),
+    },
 )
-def wikidata_dataframe(context, results):
-    if results == None:
-        context.log.info("Couldn't update")
-        return None
-
-    else:
-        ls = []
-        for result in results["results"]["bindings"]:
-            dic = {}
-            for key in result:
-                dic[f"{key}"] = result[f"{key}"]["value"]
-            ls.append(dic)
-
-        wikidata_df = pd.DataFrame(ls)
+def query_wikidata(context):
+    config = context.solid_config
+    try:
+        http = context.resources.http_cache.session(context.resources.http_client)
 
-        wikidata_df["wikidata_depict"] = (
-            wikidata_df["depict"] + " " + wikidata_df["depictLabel"]
+        return harvest_wikidata(
+            http,
+            config["endpoint"],
+            page_size=config["page_size"],
+            checkpoint=config.get("checkpoint"),
         )
 
-        wikidata_df.drop(columns=["depict", "depictLabel"], inplace=True)
+    except Exception:
+        context.log.info("Couldn't update")
+        return None
 
-        wikidata_df = wikidata_df.groupby("id", as_index=False).agg(lambda x: set(x))
 
-        def concat(a_set):
-            list_of_strings = [str(s) for s in a_set]
-            joined_string = "||".join(list_of_strings)
-            return joined_string
+def aggregate_wikidata(df):
+    """One row per id from the query rows, indexed by id.
 
-        wikidata_df["wikidata_depict"] = wikidata_df["wikidata_depict"].apply(concat)
+    wikidata_depict joins the sorted, distinct "depict label" pairs of each
+    id with "||"; the other columns take their first non-null value.
+    Missing values are empty strings.
+    """
+    depicts = df["depict"].str.cat(df["depictLabel"], sep=" ")
+    pairs = (
+        pd.DataFrame({"id": df["id"], "wikidata_depict": depicts})
+        .dropna()
+        .drop_duplicates()
+        .sort_values(["id", "wikidata_depict"])
+    )
+    scalars = [
+        column
+        for column in df.columns
+        if column not in ("id", "depict", "depictLabel")
+    ]
+
+    wikidata_df = df.groupby("id")[scalars].first()
+    wikidata_df["wikidata_depict"] = None
+    if len(pairs):
+        # pairs are sorted by id: split them where the id changes, join each run
+        ids = pairs["id"].to_numpy()
+        starts = np.flatnonzero(np.r_[True, ids[1:] != ids[:-1]])
+        runs = np.split(pairs["wikidata_depict"].to_numpy(), starts[1:])
+        joined = ["||".join(run) for run in runs]
+        wikidata_df["wikidata_depict"] = pd.Series(joined, index=ids[starts])
+    return wikidata_df.fillna("").astype(str)
 
-        wikidata_df = wikidata_df.applymap(lambda x: str(x).strip("{'}"))
 
-        wikidata_df = wikidata_df.applymap(lambda x: x.replace("nan", ""))
+@dg.solid(
+    required_resource_keys={"http_cache"},
+    output_defs=[
+        dg.OutputDefinition(
+            io_manager_key="pandas_csv", name="api_wikidata", is_required=False
+        ),
+        dg.OutputDefinition(name="harvest", is_required=False),
+    ],
+)
+def wikidata_dataframe(context, results):
+    if results == None:
+        context.log.info("Couldn't update")
+        return
 
-        wikidata_df = wikidata_df.drop_duplicates(subset="id")
+    harvest = pending_harvest(context, "api_wikidata", results)
+    if harvest is not None:
+        wikidata_df = aggregate_wikidata(pd.DataFrame(results))
 
         wikidata_df.name = "api_wikidata"
 
-        return wikidata_df.set_index("id")
+        yield dg.Output(wikidata_df, "api_wikidata")
+        yield dg.Output(harvest, "harvest")
 
 
 # PORTALS
-@dg.solid(config_schema=dg.StringSource)
-def query_portals(context):
-    endpoint = context.solid_config
-
-    retry_strategy = Retry(
-        total=3,
-        status_forcelist=[429, 500, 502, 503, 504],
-        method_whitelist=["HEAD", "GET", "OPTIONS"],
-    )
-    adapter = HTTPAdapter(max_retries=retry_strategy)
-    http = requests.Session()
-    http.mount("https://", adapter)
-    http.mount("http://", adapter)
-
-    API_STEPS = ["0", "55000"]
+PORTALS_FIELDS = ["RecordName", "id"]
+
+
+def portals_page(http, endpoint, start, size):
+    payload = {
+        "table": "AssetRecords",
+        "quicksearchstring": "jpg",
+        "maxreturned": str(size),
+        "startindex": str(start),
+    }
+    params = urllib.parse.urlencode(payload, quote_via=urllib.parse.quote)
+    response = http.post(endpoint, params=params)
+    response.raise_for_status()
+    return response.json()
+
+
+def harvest_portals(
+    http, endpoint, page_size=5000, max_page_size=55000, target_seconds=10
+):
+    """RecordName and id of every asset, as one DataFrame in index order.
+
+    The first page gives the totalcount the columns are allocated for;
+    without one, pages are read until an empty one. Page sizes double while
+    requests take less than target_seconds and halve when they take longer
+    or fail, which also lowers the ceiling; a failing page of 100 items is
+    raised.
+    """
+    columns = {field: np.empty(0, dtype=object) for field in PORTALS_FIELDS}
+    size, start, total, first = page_size, 0, None, True
+
+    while first or total is None or start < total:
+        began = monotonic()
+        try:
+            data = portals_page(http, endpoint, start, size)
+        except (requests.RequestException, ValueError):
+            if size <= 100:
+                raise
+            # the server can't take pages this big, don't grow back to them
+            size = max_page_size = size // 2
+            continue
+        elapsed = monotonic() - began
+
+        items = data.get("items") or []
+        if first and "totalcount" in data:
+            total = int(data["totalcount"])
+        first = False
+        needed = start + len(items)
+        if needed > len(columns[PORTALS_FIELDS[0]]):
+            capacity = max(needed, total or 0, 2 * len(columns[PORTALS_FIELDS[0]]))
+            for field, values in columns.items():
+                grown = np.empty(capacity, dtype=object)
+                grown[: len(values)] = values
+                columns[field] = grown
+        for field, values in columns.items():
+            values[start:needed] = [item.get(field) for item in items]
+
+        if not items:
+            break
+        start = needed
+        if elapsed < target_seconds / 2:
+            size = min(size * 2, max_page_size)
+        elif elapsed > target_seconds:
+            size = max(size // 2, 100)
+
+    return pd.DataFrame({field: values[:start] for field, values in columns.items()})
 
-    dataframe = pd.DataFrame()
 
-    for i in API_STEPS:
-
-        payload = {
-            "table": "AssetRecords",
-            "quicksearchstring": "jpg",
-            "maxreturned": "55000",
-            "startindex": i,
-        }
-
-        params = urllib.parse.urlencode(payload, quote_via=urllib.parse.quote)
-        response = http.post(endpoint, params=params)
-        data = response.json()
-        results = pd.json_normalize(data["items"])
-        dataframe = dataframe.append(results, ignore_index=True)
-
-    print(len(dataframe.shape))
+@dg.solid(
+    required_resource_keys={"http_cache", "http_client"},
+    config_schema={
+        "endpoint": dg.StringSource,
+        "page_size": dg.Field(dg.Int, is_required=False, default_value=5000),
+        "max_page_size": dg.Field(dg.Int, is_required=False, default_value=55000),
+        "target_seconds": dg.Field(
+            dg.Float,
+            is_required=False,
+            default_value=10.0,
+            description="Page sizes adapt to keep requests around this long",
+        ),
+    },
+)
+def query_portals(context):
+    config = context.solid_config
+    http = context.resources.http_cache.session(context.resources.http_client)
+
+    dataframe = harvest_portals(
+        http,
+        config["endpoint"],
+        page_size=config["page_size"],
+        max_page_size=config["max_page_size"],
+        target_seconds=config["target_seconds"],
+    )
+    context.log.info(f"{len(dataframe)} records from Portals")
 
     return dataframe
 
 
 @dg.solid(
     config_schema=dg.StringSource,
-    output_defs=[dg.OutputDefinition(io_manager_key="pandas_csv", name="api_portals")],
+    required_resource_keys={"http_cache"},
+    output_defs=[
+        dg.OutputDefinition(
+            io_manager_key="pandas_csv", name="api_portals", is_required=False
+        ),
+        dg.OutputDefinition(name="harvest", is_required=False),
+    ],
 )
 def portals_dataframe(context, results):
-    if isinstance(results, pd.DataFrame):
+    if not isinstance(results, pd.DataFrame):
+        context.log.info("Couldn't update")
+        return
+
+    harvest = pending_harvest(context, "api_portals", results)
+    if harvest is not None:
         prefix = context.solid_config
-        dataframe = pd.DataFrame()
-        dataframe = dataframe.append(results, ignore_index=True)
-        dataframe = dataframe.rename(
+        dataframe = results.rename(
             columns={
                 "id": "portals_id",
                 "RecordName": "id",
@@ -230,8 +608,5 @@ def portals_dataframe(context, results):
 
         portals_df.name = "api_portals"
 
-        return portals_df.set_index("id")
-
-    else:
-        context.log.info("Couldn't update")
-        return None
+        yield dg.Output(portals_df.set_index("id"), "api_portals")
+        yield dg.Output(harvest, "harvest")
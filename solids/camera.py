@@ -1,9 +1,9 @@
+import io
 import math
 import os
 import re
 import shutil
 from solids.utils import df_csv_io_manager
-import sys
 from typing import List
 from dotenv import load_dotenv
 
@@ -12,13 +12,10 @@ import geojson
 import mercantile
 import numpy as np
 import pandas as pd
-import requests
 from dagster.config.config_type import String
 from PIL import Image
 from pykml import parser
-from pyproj import Proj
-from shapely.geometry import Point, Polygon
-from SPARQLWrapper import JSON, SPARQLWrapper
+from solids.viewcone import distances, draw_cones
 
 load_dotenv(override=True)
 
@@ -27,84 +24,39 @@ def find_with_re(property, kml):
     return re.search(f"(?<=<{property}>).+(?=<\/{property}>)", kml).group(0)
 
 
-def reproject(coordinates, inverse=False):
-    rj = Proj("EPSG:32722")
-    origin = Point(coordinates)
-    origin_proj = rj(origin.x, origin.y, inverse=inverse)
-
-    return Point(origin_proj)
-
-
-def query_wikidata(Q):
-    endpoint_url = "https://query.wikidata.org/sparql"
+def depicted_qids(kml, metadata):
+    with open(kml, "r") as f:
+        KML = parser.parse(f).getroot()
+    depicts = metadata.get(str(KML.PhotoOverlay.name), "wikidata_depict")
+    if not isinstance(depicts, str):
+        return []
+    return [
+        re.search("(?<=\/)Q\d+", depict).group(0) for depict in depicts.split("||")
+    ]
 
-    query = """SELECT ?coordinate
-        WHERE
-        {
-        wd:%s wdt:P625 ?coordinate .
-        }""" % (
-        Q
-    )
 
-    def get_results(endpoint_url, query):
-        user_agent = "WDQS-example Python/%s.%s" % (
-            sys.version_info[0],
-            sys.version_info[1],
-        )
-        # TODO adjust user agent; see https://w.wiki/CX6
-        sparql = SPARQLWrapper(endpoint_url, agent=user_agent)
-        sparql.setQuery(query)
-        sparql.setReturnFormat(JSON)
-        return sparql.query().convert()
-
-    results = get_results(endpoint_url, query)
-    result_list = []
-    for result in results["results"]["bindings"]:
-        if result:
-            result_list.append(result["coordinate"]["value"])
-    return result_list
-
-
-def get_radius(kml):
+def get_radius(kml, metadata, coordinates):
     with open(kml, "r") as f:
 
         KML = parser.parse(f).getroot()
     id = str(KML.PhotoOverlay.name)
     tilt = KML.PhotoOverlay.Camera.tilt
-    df = pd.read_csv(
-        os.environ["METADATA"],
-        index_col="id",
-    )
-    depicts = df.loc[id, "wikidata_depict"]
+    depicts = metadata.get(id, "wikidata_depict")
     if isinstance(depicts, str):
         depicts = depicts.split("||")
-        distances = []
         points = []
         for depict in depicts:
             q = re.search("(?<=\/)Q\d+", depict).group(0)
-            point = query_wikidata(q)
+            point = coordinates.get(q)
             if point:
-                points.append(point[0])
-            else:
-                continue
-            for point in points:
-
                 lnglat = re.search("\((-\d+\.\d+) (-\d+\.\d+)\)", point)
-                lng = lnglat.group(1)
-                lat = lnglat.group(2)
-                depicted = reproject((float(lng), float(lat)))
-                origin = reproject(
-                    (
-                        KML.PhotoOverlay.Camera.longitude,
-                        KML.PhotoOverlay.Camera.latitude,
-                    )
-                )
-
-                distance = origin.distance(depicted)
-                distances.append(distance)
+                points.append(lnglat.groups())
 
-        if distances:
-            radius = max(distances)
+        if points:
+            lng, lat = np.array(points, dtype=float).T
+            camera = KML.PhotoOverlay.Camera
+            origin = (float(camera.longitude), float(camera.latitude))
+            radius = float(distances(*origin, lng, lat).max())
 
         else:
 
@@ -123,49 +75,16 @@ def get_radius(kml):
     return radius
 
 
-def draw_cone(kml, radius=400, steps=200):
-
-    with open(kml, "r") as f:
-        KML = parser.parse(f).getroot()
-
+def cone_parameters(KML):
     camera = KML.PhotoOverlay.Camera
     viewvolume = KML.PhotoOverlay.ViewVolume
-    center = Point(reproject((camera.longitude, camera.latitude)))
-    start_angle = camera.heading - viewvolume.rightFov
-    end_angle = camera.heading - viewvolume.leftFov
-
-    def polar_point(origin_point, angle, distance):
-        return [
-            origin_point.x + math.sin(math.radians(angle)) * distance,
-            origin_point.y + math.cos(math.radians(angle)) * distance,
-        ]
-
-    if start_angle > end_angle:
-        start_angle = start_angle - 360
-    else:
-        pass
-    step_angle_width = (end_angle - start_angle) / steps
-    sector_width = end_angle - start_angle
-    segment_vertices = []
-    segment_vertices.append(reproject(polar_point(center, 0, 0), inverse=True))
-    segment_vertices.append(
-        reproject(polar_point(center, start_angle, radius), inverse=True)
-    )
-    for z in range(1, steps):
-        segment_vertices.append(
-            (
-                reproject(
-                    polar_point(center, start_angle + z * step_angle_width, radius),
-                    inverse=True,
-                )
-            )
-        )
-    segment_vertices.append(
-        reproject(polar_point(center, start_angle + sector_width, radius), inverse=True)
-    )
-    segment_vertices.append(reproject(polar_point(center, 0, 0), inverse=True))
-
-    return Polygon(segment_vertices)
+    return [
+        float(camera.longitude),
+        float(camera.latitude),
+        float(camera.heading),
+        float(viewvolume.leftFov),
+        float(viewvolume.rightFov),
+    ]
 
 
 @dg.solid(config_schema=dg.StringSource)
@@ -231,8 +150,17 @@ def change_img_href(context):
     return list_kmls
 
 
-@dg.solid
+def terrain_tile(http):
+    response = http.get(
+        "https://api.mapbox.com/v4/mapbox.terrain-rgb/10/800/200.pngraw?access_token=pk.eyJ1IjoibWFydGltcGFzc29zIiwiYSI6ImNra3pmN2QxajBiYWUycW55N3E1dG1tcTEifQ.JFKSI85oP7M2gbeUTaUfQQ"
+    )
+    response.raise_for_status()
+    return Image.open(io.BytesIO(response.content)).load()
+
+
+@dg.solid(required_resource_keys={"http_client"})
 def correct_altitude_mode(context, kmls):
+    http = context.resources.http_client
 
     for kml in kmls:
         with open(kml, "r+") as f:
@@ -246,12 +174,7 @@ def correct_altitude_mode(context, kmls):
                 westmost, southmost, eastmost, northmost = mercantile.bounds(tile)
                 pixel_column = np.interp(lng, [westmost, eastmost], [0, 256])
                 pixel_row = np.interp(lat, [southmost, northmost], [256, 0])
-                tile_img = Image.open(
-                    requests.get(
-                        "https://api.mapbox.com/v4/mapbox.terrain-rgb/10/800/200.pngraw?access_token=pk.eyJ1IjoibWFydGltcGFzc29zIiwiYSI6ImNra3pmN2QxajBiYWUycW55N3E1dG1tcTEifQ.JFKSI85oP7M2gbeUTaUfQQ",
-                        stream=True,
-                    ).raw
-                ).load()
+                tile_img = terrain_tile(http)
 
                 R, G, B, _ = tile_img[int(pixel_row), int(pixel_column)]
                 height = -10000 + ((R * 256 * 256 + G * 256 + B) * 0.1)
@@ -275,44 +198,53 @@ def correct_altitude_mode(context, kmls):
 
 
 @dg.solid(
-    input_defs=[dg.InputDefinition("metadata", root_manager_key="metadata_root")],
+    required_resource_keys={"metadata_index", "http_client", "coordinate_cache"}
 )
-def create_feature(context, kmls, metadata):
+def create_feature(context, kmls):
     new_features = []
     processed_ids = []
-    metadata["upper_ids"] = metadata["id"].str.upper()
-    metadata = metadata.set_index("upper_ids")
+    cameras = []
+    feature_properties = []
+    metadata = context.resources.metadata_index
+    http = context.resources.http_client
     # Id = ""
 
+    # one lookup for every landmark depicted in the batch
+    qids = []
+    for kml in kmls:
+        try:
+            qids += depicted_qids(kml, metadata)
+        except Exception:
+            pass  # reported below, when the feature is built
+    coordinates = context.resources.coordinate_cache.resolve(qids, http)
+    context.log.info(f"Coordinates for {len(coordinates)} of {len(set(qids))} entities")
+
     for kml in kmls:
         try:
             with open(kml, "r") as f:
                 KML = parser.parse(f).getroot()
                 Id = (str(KML.PhotoOverlay.name)).upper()
-                created = metadata.loc[Id, "date_created"]
+                record = metadata.record(Id, ignore_case=True)
+                created = record["date_created"]
                 circa = (
-                    ""
-                    if pd.isna(metadata.loc[Id, "date_circa"])
-                    else str(metadata.loc[Id, "date_circa"])
+                    "" if pd.isna(record["date_circa"]) else str(record["date_circa"])
                 )
-                accurate = pd.notna(metadata.loc[Id, "date_created"])
+                accurate = pd.notna(record["date_created"])
                 properties = {
-                    "id": metadata.loc[Id, "id"],
-                    "title": ""
-                    if pd.isna(metadata.loc[Id, "title"])
-                    else str(metadata.loc[Id, "title"]),
+                    "id": record["id"],
+                    "title": "" if pd.isna(record["title"]) else str(record["title"]),
                     "description": ""
-                    if pd.isna(metadata.loc[Id, "description"])
-                    else str(metadata.loc[Id, "description"]),
+                    if pd.isna(record["description"])
+                    else str(record["description"]),
                     "creator": ""
-                    if pd.isna(metadata.loc[Id, "creator"])
-                    else str(metadata.loc[Id, "creator"]),
+                    if pd.isna(record["creator"])
+                    else str(record["creator"]),
                     "first_year": ""
-                    if pd.isna(metadata.loc[Id, "first_year"])
-                    else str(int(metadata.loc[Id, "first_year"])),
+                    if pd.isna(record["first_year"])
+                    else str(int(record["first_year"])),
                     "last_year": ""
-                    if pd.isna(metadata.loc[Id, "last_year"])
-                    else str(int(metadata.loc[Id, "last_year"])),
+                    if pd.isna(record["last_year"])
+                    else str(int(record["last_year"])),
                     "source": "Instituto Moreira Salles",
                     "longitude": str(round(float(KML.PhotoOverlay.Camera.longitude),5)),
                     "latitude": str(round(float(KML.PhotoOverlay.Camera.latitude),5)),
@@ -330,20 +262,23 @@ def create_feature(context, kmls, metadata):
                 else:
                     properties["date_circa"] = circa
 
-                radius = get_radius(kml)
+                radius = get_radius(kml, metadata, coordinates)
                 print(f"OK: {Id}")
-                if radius:
-                    viewcone = draw_cone(kml, radius=radius)
-                else:
-                    viewcone = draw_cone(kml)
-                new_features.append(
-                    geojson.Feature(geometry=viewcone, properties=properties)
-                )
+                cameras.append(cone_parameters(KML) + [radius or 400])
+                feature_properties.append(properties)
                 processed_ids.append(Id)
 
         except Exception as E:
             print(f"ERROR: {E} no ID: {Id}")
 
+    # every cone of the batch in one reprojection
+    if cameras:
+        viewcones = draw_cones(*np.array(cameras).T)
+        new_features = [
+            geojson.Feature(geometry=viewcone, properties=properties)
+            for viewcone, properties in zip(viewcones, feature_properties)
+        ]
+
     return new_features
 
 
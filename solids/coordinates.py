@@ -0,0 +1,89 @@
+import json
+import os
+import tempfile
+import time
+
+import requests
+
+WIKIDATA_SPARQL = "https://query.wikidata.org/sparql"
+ENTITY = "http://www.wikidata.org/entity/"
+
+
+def query_coordinates(qids, http, endpoint=WIKIDATA_SPARQL):
+    """Coordinate location (P625) of each Q-id, None for those without one."""
+    query = """SELECT ?item ?coordinate
+        WHERE
+        {
+        VALUES ?item { %s }
+        OPTIONAL { ?item wdt:P625 ?coordinate . }
+        }""" % (
+        " ".join(f"wd:{q}" for q in qids)
+    )
+
+    # long VALUES lists don't fit in a GET url
+    response = http.post(
+        endpoint,
+        data={"query": query},
+        headers={"Accept": "application/sparql-results+json"},
+    )
+    response.raise_for_status()
+    coordinates = dict.fromkeys(qids)
+    for result in response.json()["results"]["bindings"]:
+        q = result["item"]["value"].replace(ENTITY, "")
+        if "coordinate" in result and coordinates.get(q) is None:
+            coordinates[q] = result["coordinate"]["value"]
+    return coordinates
+
+
+class CoordinateCache:
+    """Q-id to Wikidata coordinate, kept in a JSON file between runs.
+
+    resolve() only asks Wikidata for Q-ids missing from the file or fetched
+    more than ttl seconds ago, chunk_size of them per query. Entities
+    without a coordinate are remembered too.
+    """
+
+    def __init__(self, path, ttl=90 * 24 * 3600, chunk_size=200):
+        self.path = path
+        self.ttl = ttl
+        self.chunk_size = chunk_size
+        try:
+            with open(path) as f:
+                self.entries = json.load(f)
+        except (FileNotFoundError, ValueError):
+            self.entries = {}
+
+    def resolve(self, qids, http, endpoint=WIKIDATA_SPARQL):
+        """Coordinates of qids, as "Point(lng lat)" or None.
+
+        Q-ids never fetched whose query failed are left out of the result,
+        and are treated by get_radius like entities without a coordinate.
+        """
+        now = time.time()
+        qids = sorted(set(qids))
+        stale = [
+            q
+            for q in qids
+            if q not in self.entries or now - self.entries[q]["fetched"] > self.ttl
+        ]
+        for start in range(0, len(stale), self.chunk_size):
+            chunk = stale[start : start + self.chunk_size]
+            try:
+                coordinates = query_coordinates(chunk, http, endpoint)
+            except (requests.RequestException, ValueError, KeyError):
+                # expired entries are still served until a refresh succeeds
+                continue
+            for q, coordinate in coordinates.items():
+                self.entries[q] = {"coordinate": coordinate, "fetched": now}
+
+        if stale:
+            self.save()
+        return {q: self.entries[q]["coordinate"] for q in qids if q in self.entries}
+
+    def save(self):
+        folder = os.path.dirname(self.path) or "."
+        os.makedirs(folder, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=folder, suffix=".tmp")
+        with os.fdopen(fd, "w") as f:
+            json.dump(self.entries, f, sort_keys=True)
+        os.replace(tmp_path, self.path)
@@ -1,51 +1,232 @@
+import mmap
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from xml.etree import ElementTree
+
 import dagster as dg
+import numpy as np
 import pandas as pd
 
+from solids.utils import file_digest
+
+
+CUMULUS_NS = "{http://www.canto.com/ns/Export/1.0}"
+
+# bump whenever read_cumulus_xml output changes, to invalidate snapshots
+PARSER_VERSION = 1
+
+
+def field_value(element):
+    if len(element) == 0:
+        return element.text.strip()
+    value = element[0].text.strip().split(":")
+    return str(value).strip("[']")
+
+
+def read_cumulus_layout(path):
+    """Resolve the export layout into field names and a uid -> column table."""
+    names = []
+    uid_column = {}
+    depth = 0
+    section = -1
+    layout_child = -1
+
+    for event, element in ElementTree.iterparse(path, events=("start", "end")):
+        if event == "start":
+            depth += 1
+            if depth == 2:
+                section += 1
+                if section == 1:
+                    break
+            elif depth == 3:
+                layout_child += 1
+            continue
+
+        if depth == 4 and layout_child == 0:
+            uid = element.attrib.get("uid")
+            if uid is not None:
+                name = element[0].text
+                if name not in names:
+                    names.append(name)
+                uid_column[uid] = names.index(name)
+        depth -= 1
+
+    return names, uid_column
+
+
+def split_cumulus_items(path, shards):
+    """Split the <Items> section into byte ranges that start on a record.
+
+    Returns the root start and end tags, needed to parse a range on its own,
+    and the list of (start, end) offsets in file order.
+    """
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        root = re.search(rb"<(?![?!])([^\s>/]+)[^>]*>", mm[:65536])
+        root_name = root.group(1)
+        prefix = root_name.split(b":")[0] + b":" if b":" in root_name else b""
+
+        items = re.compile(rb"<" + prefix + rb"Items[\s>]").search(mm)
+        if items is None:
+            return root.group(0), b"</" + root_name + b">", []
+        start = mm.find(b">", items.start()) + 1
+        end = mm.rfind(b"</" + prefix + b"Items>")
+        if mm[start - 2 : start] == b"/>" or end < start:
+            return root.group(0), b"</" + root_name + b">", []
+
+        def next_item(offset):
+            found = [
+                position
+                for position in (
+                    mm.find(b"<" + prefix + b"Item>", offset, end),
+                    mm.find(b"<" + prefix + b"Item ", offset, end),
+                )
+                if position != -1
+            ]
+            return min(found) if found else end
+
+        step = max((end - start) // max(shards, 1), 1)
+        bounds = [start]
+        for offset in range(start + step, end, step):
+            bound = next_item(offset)
+            if bound > bounds[-1]:
+                bounds.append(bound)
+        if bounds[-1] != end:
+            bounds.append(end)
+
+    return root.group(0), b"</" + root_name + b">", list(zip(bounds, bounds[1:]))
+
+
+class ByteRange:
+    """Read-only file object over path[start:end], wrapped in the root tags."""
+
+    def __init__(self, path, start, end, head, tail):
+        self.file = open(path, "rb")
+        self.file.seek(start)
+        self.left = end - start
+        self.head = head
+        self.tail = tail
+
+    def read(self, size=-1):
+        if self.head:
+            chunk, self.head = self.head, b""
+            return chunk
+        if self.left > 0:
+            size = self.left if size < 0 else min(size, self.left)
+            chunk = self.file.read(size)
+            self.left -= len(chunk)
+            return chunk
+        chunk, self.tail = self.tail, b""
+        return chunk
+
+    def close(self):
+        self.file.close()
+
+
+def parse_cumulus_items(path, start, end, head, tail, uid_column, width, capacity=4096):
+    """Parse the records in one byte range into a list of object columns.
+
+    Each cumulus:Item is written into preallocated columns and cleared right
+    after, so memory stays bounded by the output size, not the tree size.
+    """
+    columns = [np.empty(capacity, dtype=object) for _ in range(width)]
+    rows = 0
+    depth = 0
+    root = None
+    source = ByteRange(path, start, end, head, tail)
+
+    try:
+        for event, element in ElementTree.iterparse(source, events=("start", "end")):
+            if event == "start":
+                depth += 1
+                if depth == 1:
+                    root = element
+                continue
 
-# solids cumulus
-@dg.solid(
-    input_defs=[dg.InputDefinition("root", root_manager_key="xml_root")],
-)
-def xml_to_df(context, root):
-    # Find the uids
+            if depth == 2:
+                if rows == capacity:
+                    capacity *= 2
+                    for i, column in enumerate(columns):
+                        grown = np.empty(capacity, dtype=object)
+                        grown[:rows] = column
+                        columns[i] = grown
+                for value in element.iterfind(CUMULUS_NS + "FieldValue"):
+                    column = uid_column.get(value.attrib.get("uid"))
+                    if column is not None:
+                        columns[column][rows] = field_value(value)
+                rows += 1
+                root.clear()
+            depth -= 1
+    finally:
+        source.close()
+
+    return [column[:rows] for column in columns]
+
+
+def read_cumulus_xml(path, workers=1):
+    """Stream a Cumulus export into a DataFrame.
+
+    With workers > 1 the <Items> section is split into one shard per worker
+    and parsed in a process pool; the column blocks are concatenated in file
+    order, so the result is the same as the serial parse.
+    """
+    names, uid_column = read_cumulus_layout(path)
+    head, tail, shards = split_cumulus_items(path, workers)
+    args = [
+        (path, start, end, head, tail, uid_column, len(names))
+        for start, end in shards
+    ]
 
-    uids = {}
-    for thing in root[0][0]:
-        uids[thing.attrib["uid"]] = thing[0].text
+    if workers > 1 and len(args) > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            blocks = list(pool.map(parse_cumulus_items, *zip(*args)))
+    else:
+        blocks = [parse_cumulus_items(*arg) for arg in args]
+
+    return pd.DataFrame(
+        {
+            name: np.concatenate([block[i] for block in blocks])
+            if blocks
+            else np.empty(0, dtype=object)
+            for i, name in enumerate(names)
+        }
+    )
 
-    table = {}
-    for field in uids.values():
-        table[field] = []
 
-    outDict = {"table": table, "uids": uids}
+def cached_cumulus_xml(path, cache, workers=1, keep=3):
+    """Load the parsed export from a snapshot keyed by file and parser version.
 
-    # Fill the records
-    ns = {"cumulus": "http://www.canto.com/ns/Export/1.0"}
-    for thing in root[1]:
-        added = set()
-        for field_value in thing.findall("cumulus:FieldValue", ns):
-            try:
-                if len(field_value) == 0:
-                    value = field_value.text.strip()
-                else:
-                    value = field_value[0].text.strip().split(":")
-                    value = str(value).strip("[']")
-
-                outDict["table"][outDict["uids"][field_value.attrib["uid"]]].append(
-                    value
-                )
-                added.add(field_value.attrib["uid"])
-            except KeyError:
-                continue
-        for missing in outDict["uids"].keys() - added:
-            try:
-                outDict["table"][outDict["uids"][missing]].append(None)
-            except KeyError:
-                continue
-    formated_table = outDict["table"]
-    cumulus_df = pd.DataFrame(formated_table)
+    On a miss the export is parsed and saved as feather; only the newest
+    `keep` snapshots are kept. Returns the frame and whether it was a hit.
+    """
+    snapshot = os.path.join(
+        cache, f"cumulus-{file_digest(path)}-v{PARSER_VERSION}.feather"
+    )
+    if os.path.exists(snapshot):
+        return pd.read_feather(snapshot), True
+
+    cumulus_df = read_cumulus_xml(path, workers=workers)
+    os.makedirs(cache, exist_ok=True)
+    cumulus_df.to_feather(snapshot + ".tmp")
+    os.replace(snapshot + ".tmp", snapshot)
+
+    snapshots = sorted(
+        (
+            os.path.join(cache, name)
+            for name in os.listdir(cache)
+            if name.startswith("cumulus-") and name.endswith(".feather")
+        ),
+        key=os.path.getmtime,
+        reverse=True,
+    )
+    for old in snapshots[keep:]:
+        os.remove(old)
 
-    # load
+    return cumulus_df, False
+
+
+def format_cumulus_df(cumulus_df):
     cumulus_df = cumulus_df.astype(
         {"DATA": str, "DATA LIMITE INFERIOR": str, "DATA LIMITE SUPERIOR": str},
         copy=False,
@@ -57,6 +238,144 @@ def xml_to_df(context, root):
     return cumulus_df
 
 
+DATE = re.compile(r"([\d\/-]*\d{4}[-\/\d]*)")
+CIRCA = re.compile(r"[a-z]")
+SEPARATOR = re.compile(r"[\/-]")
+DATE_PATTERNS = [
+    re.compile(r"(?P<year>\d{4})"),
+    re.compile(r"(?P<month>\d{1,2})[\/-](?P<year>\d{4})"),
+    re.compile(r"(?P<year>\d{4})[\/-](?P<month>\d{1,2})"),
+    re.compile(r"(?P<day>\d{1,2})[\/-](?P<month>\d{1,2})[\/-](?P<year>\d{4})"),
+    re.compile(r"(?P<year>\d{4})[\/-](?P<month>\d{1,2})[\/-](?P<day>\d{1,2})"),
+]
+
+
+@lru_cache(maxsize=None)
+def classify_date(text):
+    if not isinstance(text, str):
+        return np.nan
+    if CIRCA.search(text):
+        return "circa"
+    return {0: "year", 1: "month", 2: "day"}.get(len(SEPARATOR.findall(text)), np.nan)
+
+
+@lru_cache(maxsize=None)
+def parse_date(text):
+    """Parse one catalogue date (YYYY, MM/YYYY, DD/MM/YYYY or circa text)."""
+    if not isinstance(text, str):
+        return pd.NaT
+    found = DATE.search(text)
+    if found is None:
+        return pd.NaT
+    for pattern in DATE_PATTERNS:
+        match = pattern.fullmatch(found.group(1))
+        if match:
+            parts = match.groupdict()
+            try:
+                return pd.Timestamp(
+                    year=int(parts["year"]),
+                    month=int(parts.get("month") or 1),
+                    day=int(parts.get("day") or 1),
+                )
+            except ValueError:
+                return pd.NaT
+    return pd.to_datetime(found.group(1), errors="coerce", dayfirst=True)
+
+
+def classify_dates(series):
+    codes, uniques = pd.factorize(series)
+    accuracy = np.array([classify_date(x) for x in uniques] + [np.nan], dtype=object)
+    return pd.Series(accuracy[codes], index=series.index)
+
+
+def parse_dates(series):
+    """Parse each distinct string once and broadcast the results back."""
+    codes, uniques = pd.factorize(series)
+    parsed = pd.DatetimeIndex([parse_date(x) for x in uniques] + [pd.NaT])
+    return pd.Series(parsed[codes], index=series.index)
+
+
+# solids cumulus
+@dg.solid(
+    config_schema={
+        "workers": dg.Field(dg.Int, is_required=False, default_value=1),
+        "cache": dg.Field(dg.StringSource, is_required=False),
+    },
+    input_defs=[dg.InputDefinition("path", root_manager_key="xml_root")],
+)
+def xml_to_df(context, path):
+    workers = context.solid_config["workers"]
+    cache = context.solid_config.get("cache")
+
+    if cache:
+        cumulus_df, hit = cached_cumulus_xml(path, cache, workers=workers)
+        if hit:
+            context.log.info(f"Loaded {len(cumulus_df)} records from snapshot")
+        else:
+            context.log.info(f"Parsed {len(cumulus_df)} records from {path}")
+    else:
+        cumulus_df = read_cumulus_xml(path, workers=workers)
+        context.log.info(f"Parsed {len(cumulus_df)} records from {path}")
+
+    # load
+    return format_cumulus_df(cumulus_df)
+
+
+def record_fingerprints(df):
+    """Hash every raw record, keyed by Record Name."""
+    fingerprints = pd.DataFrame(
+        {
+            "Record Name": df["Record Name"],
+            "fingerprint": pd.util.hash_pandas_object(df, index=False).astype(str),
+        }
+    )
+    return fingerprints.groupby("Record Name", sort=False)["fingerprint"].agg("|".join)
+
+
+@dg.solid(
+    config_schema={
+        "fingerprints": dg.StringSource,
+        "incremental": dg.Field(dg.Bool, is_required=False, default_value=False),
+    },
+    output_defs=[
+        dg.OutputDefinition(name="records", is_required=False),
+        dg.OutputDefinition(name="changes"),
+    ],
+)
+def select_changes(context, df):
+    path = context.solid_config["fingerprints"]
+    fingerprints = record_fingerprints(df)
+    changes = {
+        "incremental": False,
+        "deleted": [],
+        "fingerprints": fingerprints,
+        "path": path,
+    }
+
+    if context.solid_config["incremental"] and os.path.exists(path):
+        previous = pd.read_csv(path, index_col="Record Name", dtype=str)["fingerprint"]
+        record_ids = df["Record Name"].str.split(".", n=1).str[0]
+
+        # records sharing an id are deduplicated together, so they change together
+        changed = fingerprints[fingerprints.ne(previous.reindex(fingerprints.index))]
+        removed = previous.index.difference(fingerprints.index)
+        removed_ids = set(removed.str.split(".", n=1).str[0])
+        changed_ids = set(record_ids[df["Record Name"].isin(changed.index)])
+        changed_ids |= removed_ids & set(record_ids)
+
+        changes["incremental"] = True
+        changes["deleted"] = sorted(removed_ids - set(record_ids))
+        df = df[record_ids.isin(changed_ids)]
+        context.log.info(
+            f"{len(changed)} added or changed, {len(removed)} deleted records"
+        )
+
+    # an empty frame still carries deletions through to merge_cumulus
+    if len(df) > 0 or changes["deleted"]:
+        yield dg.Output(df, "records")
+    yield dg.Output(changes, "changes")
+
+
 @dg.solid
 def organize_columns(context, df):
     # rename columns
@@ -95,7 +414,7 @@ def organize_columns(context, df):
     ]
 
     # remove file extension
-    cumulus_df["id"] = cumulus_df["id"].str.split(".", n=1, expand=True)
+    cumulus_df["id"] = cumulus_df["id"].str.split(".", n=1).str[0]
 
     # remove duplicates
     cumulus_df = cumulus_df.drop_duplicates(subset="id", keep="last")
@@ -130,30 +449,14 @@ def extract_dimensions(context, df):
     return df
 
 
-@dg.solid(
-    output_defs=[dg.OutputDefinition(io_manager_key="pandas_csv", name="cumulus")]
-)
+@dg.solid
 def dates_accuracy(context, df):
-    circa = df["date"].str.contains(r"[a-z]", na=False)
-    year = df["date"].str.count(r"[\/-]") == 0
-    month = df["date"].str.count(r"[\/-]") == 1
-    day = df["date"].str.count(r"[\/-]") == 2
-
-    df.loc[year, "date_accuracy"] = "year"
-    df.loc[month, "date_accuracy"] = "month"
-    df.loc[day, "date_accuracy"] = "day"
-    df.loc[circa, "date_accuracy"] = "circa"
+    df["date_accuracy"] = classify_dates(df["date"])
 
     # format date
-    df["date"] = df["date"].str.extract(r"([\d\/-]*\d{4}[-\/\d]*)")
-    df["first_year"] = df["first_year"].str.extract(r"([\d\/-]*\d{4}[-\/\d]*)")
-    df["last_year"] = df["last_year"].str.extract(r"([\d\/-]*\d{4}[-\/\d]*)")
-
-    df[["first_year", "last_year"]] = df[["first_year", "last_year"]].astype("str")
-
-    df[["date", "first_year", "last_year"]] = df[
-        ["date", "first_year", "last_year"]
-    ].applymap(lambda x: pd.to_datetime(x, errors="coerce", yearfirst=True))
+    df["date"] = parse_dates(df["date"])
+    df["first_year"] = parse_dates(df["first_year"])
+    df["last_year"] = parse_dates(df["last_year"])
 
     # fill dates
     circa = df["date_accuracy"] == "circa"
@@ -187,8 +490,45 @@ def dates_accuracy(context, df):
     )
     #########
 
-    cumulus = df
-    cumulus.name = "cumulus"
     # print("CUMULUS:", cumulus["first_year"].dtypes)
     # print(cumulus.head())
-    return cumulus.set_index("id")
+    return df.set_index("id")
+
+
+@dg.solid(
+    config_schema=dg.StringSource,
+    output_defs=[dg.OutputDefinition(io_manager_key="pandas_csv", name="cumulus")],
+)
+def merge_cumulus(context, df, changes):
+    if changes["incremental"]:
+        current = pd.read_csv(
+            context.solid_config,
+            index_col="id",
+            dtype=str,
+            keep_default_na=False,
+            na_values=[""],
+        )
+        # match the text the csv io manager writes for a full run
+        df = df.copy()
+        for column in df.select_dtypes("datetime").columns:
+            df[column] = df[column].dt.strftime("%Y-%m-%d")
+
+        current = current.drop(index=changes["deleted"], errors="ignore")
+        current = current.drop(index=df.index, errors="ignore")
+        df = pd.concat([current, df])
+
+    cumulus = df
+    cumulus.name = "cumulus"
+    return cumulus
+
+
+@dg.solid(
+    input_defs=[
+        dg.InputDefinition("changes"),
+        dg.InputDefinition("cumulus", dg.Nothing),
+        dg.InputDefinition("metadata", dg.Nothing),
+    ]
+)
+def save_fingerprints(context, changes):
+    """Record what was ingested, once cumulus.csv and the metadata are written."""
+    changes["fingerprints"].to_csv(changes["path"], header=True)
@@ -0,0 +1,100 @@
+import os
+import subprocess
+
+# directories of the data submodule read or written by the pipelines
+DATA_PATHS = ["input", "output"]
+
+
+def git(args, cwd=".", timeout=300):
+    """Run a git command, waiting at most timeout seconds; returns stdout.
+
+    Raises subprocess.CalledProcessError or subprocess.TimeoutExpired.
+    """
+    result = subprocess.run(
+        ["git"] + list(args),
+        cwd=cwd,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        universal_newlines=True,
+        timeout=timeout,
+        check=True,
+    )
+    return result.stdout
+
+
+def pull_submodule(submodule="data", paths=DATA_PATHS, depth=1, timeout=600):
+    """Shallow update of the submodule, checking out and fetching only paths.
+
+    The first pull clones the submodule blobless and without a checkout, so
+    the sparse-checkout is in place before anything is checked out; file
+    contents are then fetched only for paths, now and on later pulls.
+    """
+    git(["submodule", "init", "--", submodule], timeout=timeout)
+    if paths:
+        cloned = False
+        if not os.path.exists(os.path.join(submodule, ".git")):
+            url = git(["config", "--get", f"submodule.{submodule}.url"]).strip()
+            clone = ["clone", "--no-checkout", "--filter=blob:none"]
+            if depth:
+                clone.append(f"--depth={depth}")
+            git(clone + [url, submodule], timeout=timeout)
+            cloned = True
+        git(["sparse-checkout", "init", "--cone"], cwd=submodule, timeout=timeout)
+        git(["sparse-checkout", "set"] + list(paths), cwd=submodule, timeout=timeout)
+        if cloned:
+            # fill the index; submodule update skips a HEAD already at the commit
+            git(["checkout", "--detach", "HEAD"], cwd=submodule, timeout=timeout)
+
+    update = ["submodule", "update", "--recursive"]
+    if depth:
+        update.append(f"--depth={depth}")
+    return git(update + ["--", submodule], timeout=timeout)
+
+
+def changed_rows(submodule="data"):
+    """Rows added and removed per staged file, from git diff --numstat.
+
+    Outputs are written one row (or feature) per line in a stable order, so
+    changed lines are changed rows; a modified row counts as one removed and
+    one added. Binary files are reported with None.
+    """
+    report = {}
+    numstat = git(["diff", "--cached", "--numstat", "--no-renames"], cwd=submodule)
+    for line in numstat.splitlines():
+        added, removed, path = line.split("\t", 2)
+        report[path] = {
+            "added": None if added == "-" else int(added),
+            "removed": None if removed == "-" else int(removed),
+        }
+    return report
+
+
+def push_submodule(submodule="data", message="Update data", branch="main", timeout=600):
+    """Commit every tracked change in the submodule and push it to branch.
+
+    Returns the changed-rows report, empty when there was nothing to commit.
+    """
+    git(["add", "--update"], cwd=submodule, timeout=timeout)
+    report = changed_rows(submodule)
+    if report:
+        git(["commit", "--quiet", "-m", message], cwd=submodule, timeout=timeout)
+        git(["push", "origin", f"HEAD:{branch}"], cwd=submodule, timeout=timeout)
+    return report
+
+
+def bump_submodule(submodule="data", message="Update submodule", branch=None, timeout=600):
+    """Record the submodule's new commit in this repository and push it.
+
+    Returns False when the recorded commit was already up to date.
+    """
+    if branch:
+        git(["checkout", branch], timeout=timeout)
+    git(["add", submodule], timeout=timeout)
+    try:
+        git(["diff", "--cached", "--quiet", "--", submodule], timeout=timeout)
+        return False
+    except subprocess.CalledProcessError:
+        pass
+    git(["commit", "--quiet", "-m", message, "--", submodule], timeout=timeout)
+    git(["push"], timeout=timeout)
+    return True
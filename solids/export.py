@@ -33,7 +33,15 @@ def load_metadata(_, metadata):
 
     return export_df
 
-@dg.solid(input_defs=[dg.InputDefinition("smapshot", root_manager_key="smapshot_root")])
+@dg.solid(
+    input_defs=[
+        dg.InputDefinition(
+            "smapshot",
+            root_manager_key="smapshot_root",
+            metadata={"columns": {"id": "str"}},
+        )
+    ]
+)
 def organize_columns_to_omeka(_, df, smapshot):
     # filter items
     df = df.dropna(
@@ -0,0 +1,166 @@
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+
+import requests
+from requests.structures import CaseInsensitiveDict
+
+
+class CachedResponse:
+    """The parts of requests.Response the solids use, replayed from disk."""
+
+    def __init__(self, url, status_code, headers, content, from_cache):
+        self.url = url
+        self.status_code = status_code
+        self.headers = CaseInsensitiveDict(headers)
+        self.content = content
+        self.from_cache = from_cache
+
+    @property
+    def text(self):
+        return self.content.decode("utf-8")
+
+    def json(self):
+        return json.loads(self.content)
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.HTTPError(f"{self.status_code} for url: {self.url}")
+
+
+class HttpCache:
+    """On-disk HTTP cache driven by ETag and Last-Modified validators.
+
+    Every request is revalidated: a stored response is sent back with
+    If-None-Match / If-Modified-Since and replayed from disk on a 304.
+    evict() drops entries not used for ttl seconds, then the least recently
+    used ones until the cache fits in max_size bytes.
+    """
+
+    def __init__(self, path, ttl=30 * 24 * 3600, max_size=512 * 2 ** 20):
+        self.path = path
+        self.ttl = ttl
+        self.max_size = max_size
+        self.lock = threading.Lock()
+        os.makedirs(path, exist_ok=True)
+
+    def session(self, http):
+        return CachedSession(self, http)
+
+    def seen(self, name, fingerprint):
+        """Whether fingerprint is the one last recorded for name."""
+        try:
+            with open(os.path.join(self.path, f"{name}.fingerprint")) as f:
+                return f.read() == fingerprint
+        except FileNotFoundError:
+            return False
+
+    def record(self, name, fingerprint):
+        """Record fingerprint for name, once its output has been written.
+
+        Each name has its own file, so steps in separate processes don't
+        overwrite each other's fingerprints.
+        """
+        self._write(f"{name}.fingerprint", fingerprint.encode("utf-8"))
+
+    def key(self, method, url, body=None):
+        digest = hashlib.sha256(f"{method} {url}".encode("utf-8"))
+        if body:
+            digest.update(body if isinstance(body, bytes) else str(body).encode("utf-8"))
+        return digest.hexdigest()
+
+    def load_meta(self, key):
+        try:
+            with open(os.path.join(self.path, key + ".json")) as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def load(self, key):
+        meta = self.load_meta(key)
+        try:
+            with open(os.path.join(self.path, key + ".body"), "rb") as f:
+                return meta, f.read()
+        except FileNotFoundError:
+            return None, None
+
+    def store(self, key, meta, content=None):
+        meta["used"] = time.time()
+        if content is not None:
+            meta["size"] = len(content)
+            self._write(key + ".body", content)
+        self._write(key + ".json", json.dumps(meta).encode("utf-8"))
+
+    def _write(self, name, content):
+        fd, tmp_path = tempfile.mkstemp(dir=self.path, suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            f.write(content)
+        os.replace(tmp_path, os.path.join(self.path, name))
+
+    def evict(self):
+        with self.lock:
+            entries = []
+            for name in os.listdir(self.path):
+                if not name.endswith(".json"):
+                    continue
+                key = name[: -len(".json")]
+                meta = self.load_meta(key)
+                if meta is not None:
+                    entries.append((meta["used"], key, meta["size"]))
+
+            now = time.time()
+            size = sum(length for _, _, length in entries)
+            for used, key, length in sorted(entries):
+                if now - used <= self.ttl and size <= self.max_size:
+                    break
+                for suffix in (".json", ".body"):
+                    try:
+                        os.remove(os.path.join(self.path, key + suffix))
+                    except FileNotFoundError:
+                        pass
+                size -= length
+
+
+class CachedSession:
+    """Wraps a requests.Session, answering GET and POST through an HttpCache."""
+
+    def __init__(self, cache, http):
+        self.cache = cache
+        self.http = http
+
+    def get(self, url, params=None, **kwargs):
+        return self.request("GET", url, params=params, **kwargs)
+
+    def post(self, url, params=None, data=None, **kwargs):
+        return self.request("POST", url, params=params, data=data, **kwargs)
+
+    def request(self, method, url, params=None, data=None, headers=None, **kwargs):
+        prepared = requests.Request(method, url, params=params, data=data).prepare()
+        key = self.cache.key(method, prepared.url, prepared.body)
+        meta, content = self.cache.load(key)
+
+        headers = dict(headers or {})
+        if meta is not None:
+            if meta.get("etag"):
+                headers["If-None-Match"] = meta["etag"]
+            if meta.get("last_modified"):
+                headers["If-Modified-Since"] = meta["last_modified"]
+
+        response = self.http.request(
+            method, url, params=params, data=data, headers=headers, **kwargs
+        )
+        if response.status_code == 304 and meta is not None:
+            self.cache.store(key, meta)
+            return CachedResponse(url, 200, meta["headers"], content, True)
+
+        validators = {
+            "etag": response.headers.get("ETag"),
+            "last_modified": response.headers.get("Last-Modified"),
+        }
+        if response.status_code == 200 and any(validators.values()):
+            meta = dict(validators, headers=dict(response.headers), url=prepared.url)
+            self.cache.store(key, meta, response.content)
+        return response
@@ -0,0 +1,164 @@
+import threading
+from collections import defaultdict
+from email.utils import parsedate_to_datetime
+from time import monotonic, sleep, time
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util import Retry
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class TokenBucket:
+    """Allows rate calls a second on average, in bursts of up to burst calls."""
+
+    def __init__(self, rate, burst=1):
+        self.rate = rate
+        self.burst = max(burst, 1)
+        self.tokens = self.burst
+        self.updated = monotonic()
+        self.paused_until = 0
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = monotonic()
+                if now >= self.paused_until:
+                    self.tokens = min(
+                        self.burst, self.tokens + (now - self.updated) * self.rate
+                    )
+                    self.updated = now
+                    if self.tokens >= 1 or not self.rate:
+                        self.tokens -= 1
+                        return
+                    delay = (1 - self.tokens) / self.rate
+                else:
+                    delay = self.paused_until - now
+            sleep(delay)
+
+    def pause(self, seconds):
+        """Hold every caller back for seconds, e.g. after a Retry-After."""
+        with self.lock:
+            self.paused_until = max(self.paused_until, monotonic() + seconds)
+            self.tokens = 0
+            self.updated = self.paused_until
+
+
+def retry_after(response):
+    """Seconds asked for by a Retry-After header, or None."""
+    value = response.headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        return max(float(value), 0)
+    except ValueError:
+        pass
+    try:
+        return max(parsedate_to_datetime(value).timestamp() - time(), 0)
+    except (TypeError, ValueError):
+        return None
+
+
+class HttpClient:
+    """One pooled, keep-alive session for every outbound call.
+
+    Requests to each host are spaced by a token bucket (rate per second,
+    `rates` overrides it per host). 429 and 5xx answers are retried with
+    exponential backoff, or after the Retry-After the server sent, during
+    which the whole host is paused. Counts and latencies are kept per host.
+    """
+
+    def __init__(
+        self,
+        rate=4,
+        burst=4,
+        rates=None,
+        retries=3,
+        backoff=1,
+        pool_size=10,
+        timeout=60,
+        user_agent="situated-views/1.0 (https://imaginerio.org)",
+    ):
+        self.rate = rate
+        self.burst = burst
+        self.rates = rates or {}
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+
+        # urllib3 only retries connection errors; statuses are handled below
+        adapter = HTTPAdapter(
+            pool_connections=pool_size,
+            pool_maxsize=pool_size,
+            max_retries=Retry(
+                total=retries, backoff_factor=backoff, respect_retry_after_header=False
+            ),
+        )
+        self.session = requests.Session()
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.session.headers["User-Agent"] = user_agent
+
+        self.lock = threading.Lock()
+        self.buckets = {}
+        self.stats = defaultdict(
+            lambda: dict(requests=0, retries=0, errors=0, seconds=0.0, slowest=0.0)
+        )
+
+    def bucket(self, host):
+        with self.lock:
+            if host not in self.buckets:
+                rate = self.rates.get(host, self.rate)
+                self.buckets[host] = TokenBucket(rate, self.burst)
+            return self.buckets[host]
+
+    def get(self, url, params=None, **kwargs):
+        return self.request("GET", url, params=params, **kwargs)
+
+    def post(self, url, params=None, data=None, **kwargs):
+        return self.request("POST", url, params=params, data=data, **kwargs)
+
+    def request(self, method, url, **kwargs):
+        host = urlparse(url).netloc
+        bucket = self.bucket(host)
+        kwargs.setdefault("timeout", self.timeout)
+
+        for attempt in range(self.retries + 1):
+            bucket.acquire()
+            began = monotonic()
+            try:
+                response = self.session.request(method, url, **kwargs)
+            except requests.RequestException:
+                self.record(host, monotonic() - began, error=True)
+                raise
+            self.record(host, monotonic() - began, retry=attempt > 0)
+
+            if response.status_code not in RETRY_STATUSES or attempt == self.retries:
+                return response
+            delay = retry_after(response)
+            if delay is None:
+                delay = self.backoff * 2 ** attempt
+            bucket.pause(delay)
+        return response
+
+    def record(self, host, seconds, retry=False, error=False):
+        with self.lock:
+            stats = self.stats[host]
+            stats["requests"] += 1
+            stats["retries"] += int(retry)
+            stats["errors"] += int(error)
+            stats["seconds"] += seconds
+            stats["slowest"] = max(stats["slowest"], seconds)
+
+    def metrics(self):
+        with self.lock:
+            return {
+                host: dict(stats, mean=stats["seconds"] / stats["requests"])
+                for host, stats in self.stats.items()
+            }
+
+    def close(self):
+        self.session.close()
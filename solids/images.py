@@ -22,7 +22,13 @@ class Image:
 
 @dg.solid(
     config_schema=dg.StringSource,
-    input_defs=[dg.InputDefinition("camera", root_manager_key="camera_root")],
+    input_defs=[
+        dg.InputDefinition(
+            "camera",
+            root_manager_key="camera_root",
+            metadata={"columns": {"id": "str"}},
+        )
+    ],
 )
 def file_picker(context, camera):
     source = context.solid_config
@@ -155,46 +161,42 @@ def create_images_df(context, files):
     return images_df.set_index("id", inplace=True)
 
 
-@dg.solid(
-    config_schema=dg.StringSource,
-    input_defs=[dg.InputDefinition("metadata", root_manager_key="metadata_root")],
-)
-def write_metadata(context, metadata, files_to_tag):
-
-    metadata.fillna(value="", inplace=True)
-    metadata.set_index("id", inplace=True)
+@dg.solid(config_schema=dg.StringSource, required_resource_keys={"metadata_index"})
+def write_metadata(context, files_to_tag):
+    metadata = context.resources.metadata_index
 
     for i, item in enumerate(files_to_tag):
         if item.endswith(".jpg"):
             basename = os.path.split(item)[1]
             name = basename.split(".")[0]
+            record = metadata.record(name, fill="")
             try:
-                if metadata.loc[name, "date_accuracy"] == "circa":
+                if record["date_accuracy"] == "circa":
                     datecreated = (
-                        metadata.loc[name, "first_year"].strftime("%Y")
+                        record["first_year"].strftime("%Y")
                         + "/"
-                        + metadata.loc[name, "last_year"].strftime("%Y")
+                        + record["last_year"].strftime("%Y")
                     )
-                elif metadata.loc[name, "date_accuracy"] == "year":
-                    datecreated = metadata.loc[name, "date"].strftime("%Y")
-                elif metadata.loc[name, "date_accuracy"] == "month":
-                    datecreated = metadata.loc[name, "date"].strftime("%Y-%m")
-                elif metadata.loc[name, "date_accuracy"] == "day":
-                    datecreated = metadata.loc[name, "date"].strftime("%Y-%m-%d")
+                elif record["date_accuracy"] == "year":
+                    datecreated = record["date"].strftime("%Y")
+                elif record["date_accuracy"] == "month":
+                    datecreated = record["date"].strftime("%Y-%m")
+                elif record["date_accuracy"] == "day":
+                    datecreated = record["date"].strftime("%Y-%m-%d")
             except AttributeError:
                 print(f"Review {basename} date")
                 datecreated = ""
                 continue
-            byline = metadata.loc[name, "creator"]
-            headline = metadata.loc[name, "title"]
-            caption = metadata.loc[name, "description"]
-            objecttype = metadata.loc[name, "type"]
-            dimensions = f'{metadata.loc[name, "image_width"]}cm x {metadata.loc[name, "image_height"]}cm'
-            keywords = metadata.loc[name, "wikidata_depict"].split("||")
-            latitude = metadata.loc[name, "latitude"]
-            longitude = metadata.loc[name, "longitude"]
-            altitude = metadata.loc[name, "height"]
-            imgdirection = metadata.loc[name, "heading"]
+            byline = record["creator"]
+            headline = record["title"]
+            caption = record["description"]
+            objecttype = record["type"]
+            dimensions = f'{record["image_width"]}cm x {record["image_height"]}cm'
+            keywords = record["wikidata_depict"].split("||")
+            latitude = record["latitude"]
+            longitude = record["longitude"]
+            altitude = record["height"]
+            imgdirection = record["heading"]
 
             params = [
                 "-IPTC:Source=Instituto Moreira Salles/IMS",
@@ -223,7 +225,7 @@ def write_metadata(context, metadata, files_to_tag):
                     dest = item.encode(encoding="utf-8")
                     et.execute(param, dest)
             context.log.info(
-                f"{basename}\n{metadata.loc[name, 'date']}\nTagged {i+1} of {len(files_to_tag)} images"
+                f"{basename}\n{record['date']}\nTagged {i+1} of {len(files_to_tag)} images"
             )
 
 
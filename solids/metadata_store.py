@@ -0,0 +1,230 @@
+import sqlite3
+import time
+from contextlib import closing
+
+import numpy as np
+import pandas as pd
+
+
+class StaleRecordError(Exception):
+    """Raised when records changed in the store after they were read."""
+
+    def __init__(self, ids):
+        self.ids = ids
+        super().__init__(
+            f"{len(ids)} records changed since they were read: {ids[:10]}"
+        )
+
+
+def quote(column):
+    return '"' + str(column).replace('"', '""') + '"'
+
+
+def to_cells(df):
+    """Rows of sqlite-ready values: NaN becomes NULL, dates become text."""
+    df = df.copy()
+    for column in df.select_dtypes("datetime").columns:
+        df[column] = df[column].dt.strftime("%Y-%m-%d")
+    df = df.astype(object).where(df.notna(), None)
+
+    def cell(value):
+        if isinstance(value, np.generic):
+            value = value.item()
+        if value is None or isinstance(value, (str, int, float)):
+            return value
+        return str(value)
+
+    return [
+        (str(id), [cell(value) for value in row])
+        for id, row in zip(df.index, df.to_numpy())
+    ]
+
+
+class MetadataStore:
+    """The metadata table in sqlite, indexed on id.
+
+    Writers only touch the columns they bring, inside one transaction, so
+    pipelines running at the same time no longer overwrite each other's
+    columns. Every row carries a _version that is bumped on each write;
+    a frame read with versions and written back fails with
+    StaleRecordError if any of its rows changed in between.
+
+    metadata.csv at export_path is written by export(), under the write
+    lock, and the fingerprints of those exports are kept, so a csv that does
+    not match any of them is known to come from elsewhere (e.g. a pull).
+    """
+
+    KEEP_EXPORTS = 100
+
+    def __init__(self, path, export_path=None, timeout=60):
+        self.path = path
+        self.export_path = export_path
+        self.timeout = timeout
+        with self.transaction() as con:
+            con.execute(
+                "CREATE TABLE IF NOT EXISTS metadata "
+                "(id TEXT PRIMARY KEY, _version INTEGER NOT NULL DEFAULT 0)"
+            )
+            con.execute(
+                "CREATE TABLE IF NOT EXISTS exports "
+                "(fingerprint TEXT PRIMARY KEY, created REAL NOT NULL)"
+            )
+
+    def connect(self):
+        con = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None)
+        con.execute("PRAGMA journal_mode=WAL")
+        return con
+
+    def transaction(self):
+        return _Transaction(self.connect())
+
+    def columns(self, con=None):
+        if con is None:
+            with closing(self.connect()) as con:
+                return self.columns(con)
+        return [
+            row[1]
+            for row in con.execute("PRAGMA table_info(metadata)")
+            if row[1] not in ("id", "_version")
+        ]
+
+    def __len__(self):
+        with closing(self.connect()) as con:
+            return con.execute("SELECT COUNT(*) FROM metadata").fetchone()[0]
+
+    def read(self, columns=None, versions=False, con=None):
+        if con is None:
+            with closing(self.connect()) as con:
+                return self.read(columns, versions, con)
+        columns = self.columns(con) if columns is None else list(columns)
+        selected = ["id"] + columns + (["_version"] if versions else [])
+        query = f"SELECT {', '.join(map(quote, selected))} FROM metadata ORDER BY id"
+        return pd.read_sql_query(query, con, index_col="id")
+
+    def update(self, df, insert=False):
+        """Write the non-null cells of df, indexed by id, like DataFrame.update.
+
+        As with DataFrame.update, columns the store doesn't have are ignored;
+        only replace() adds columns. With insert=True, ids missing from the
+        store are added. If df has a _version column, those rows are checked
+        against the store first.
+        """
+        df = df.copy()
+        versions = df.pop("_version") if "_version" in df.columns else None
+
+        with self.transaction() as con:
+            existing = set(self.columns(con))
+            columns = [column for column in df.columns if column in existing]
+            cells = to_cells(df[columns])
+            assignments = "".join(
+                f"{quote(column)} = COALESCE(?, {quote(column)}), "
+                for column in columns
+            )
+            if versions is not None:
+                stored = dict(con.execute("SELECT id, _version FROM metadata"))
+                stale = [
+                    str(id)
+                    for id, version in versions.items()
+                    if str(id) in stored and stored[str(id)] != version
+                ]
+                if stale:
+                    raise StaleRecordError(stale)
+            if insert:
+                con.executemany(
+                    "INSERT OR IGNORE INTO metadata (id) VALUES (?)",
+                    [(id,) for id, _ in cells],
+                )
+            if columns:
+                con.executemany(
+                    f"UPDATE metadata SET {assignments}_version = _version + 1 "
+                    "WHERE id = ?",
+                    [values + [id] for id, values in cells],
+                )
+
+    def replace(self, df, versions=None):
+        """Swap the whole table for df, keeping row versions monotonic.
+
+        versions are the _version of every row when the rebuild started, as
+        read(versions=True) returns them; if any row was written, added or
+        removed since, StaleRecordError is raised and nothing is replaced.
+        """
+        columns = [column for column in df.columns if column != "_version"]
+        cells = to_cells(df[columns])
+        names = ", ".join(map(quote, ["id", "_version"] + columns))
+        placeholders = ", ".join("?" for _ in range(len(columns) + 2))
+
+        with self.transaction() as con:
+            stored = dict(con.execute("SELECT id, _version FROM metadata"))
+            if versions is not None:
+                expected = {str(id): version for id, version in versions.items()}
+                stale = sorted(
+                    id
+                    for id in set(stored) | set(expected)
+                    if stored.get(id) != expected.get(id)
+                )
+                if stale:
+                    raise StaleRecordError(stale)
+            con.execute("DROP TABLE metadata")
+            con.execute(
+                "CREATE TABLE metadata "
+                "(id TEXT PRIMARY KEY, _version INTEGER NOT NULL DEFAULT 0)"
+            )
+            self._add_columns(con, columns)
+            con.executemany(
+                f"INSERT OR REPLACE INTO metadata ({names}) VALUES ({placeholders})",
+                [[id, stored.get(id, -1) + 1] + values for id, values in cells],
+            )
+
+    def export(self, write):
+        """Call write(df) with the whole table, inside a write transaction.
+
+        write saves df to export_path and returns the sha256 of what it
+        wrote. No other write can land while it runs, so of two overlapping
+        exports the one that sees the newer table is always written last.
+        """
+        with self.transaction() as con:
+            fingerprint = write(self.read(con=con))
+            self._mark_exported(con, fingerprint)
+        return fingerprint
+
+    def mark_exported(self, fingerprint):
+        with self.transaction() as con:
+            self._mark_exported(con, fingerprint)
+
+    def exported(self, fingerprint):
+        """Whether fingerprint is that of a recent export of this store."""
+        with closing(self.connect()) as con:
+            query = "SELECT 1 FROM exports WHERE fingerprint = ?"
+            return con.execute(query, (fingerprint,)).fetchone() is not None
+
+    def _mark_exported(self, con, fingerprint):
+        con.execute(
+            "INSERT OR REPLACE INTO exports VALUES (?, ?)", (fingerprint, time.time())
+        )
+        con.execute(
+            "DELETE FROM exports WHERE fingerprint NOT IN "
+            "(SELECT fingerprint FROM exports ORDER BY created DESC LIMIT ?)",
+            (self.KEEP_EXPORTS,),
+        )
+
+    def _add_columns(self, con, columns):
+        existing = set(self.columns(con))
+        for column in columns:
+            if column not in existing:
+                con.execute(f"ALTER TABLE metadata ADD COLUMN {quote(column)}")
+                existing.add(column)
+
+
+class _Transaction:
+    def __init__(self, con):
+        self.con = con
+
+    def __enter__(self):
+        self.con.execute("BEGIN IMMEDIATE")
+        return self.con
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        try:
+            self.con.execute("ROLLBACK" if exc_type else "COMMIT")
+        finally:
+            self.con.close()
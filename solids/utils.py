@@ -1,11 +1,62 @@
+import hashlib
+import io
+import json
 import os
 import subprocess
+import tempfile
 from xml.etree import ElementTree
 
 import dagster as dg
-import geojson
 import geopandas as gpd
 import pandas as pd
+from shapely.geometry import shape
+
+from solids.coordinates import CoordinateCache
+from solids.data_sync import DATA_PATHS, bump_submodule, pull_submodule, push_submodule
+from solids.http_cache import HttpCache
+from solids.http_client import HttpClient
+from solids.metadata_store import MetadataStore
+
+
+def write_if_changed(path, content):
+    """Atomically replace path with content, unless it already holds it.
+
+    Returns the sha256 of the content, or None when the file is unchanged.
+    """
+    fingerprint = hashlib.sha256(content).hexdigest()
+    if os.path.exists(path):
+        with open(path, "rb") as f:
+            if hashlib.sha256(f.read()).hexdigest() == fingerprint:
+                return None
+
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path) or ".", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(content)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+    return fingerprint
+
+
+def output_events(context, obj_name, fingerprint):
+    if fingerprint is None:
+        context.log.info(f"{obj_name.upper()} is unchanged, nothing was written")
+        yield dg.EventMetadataEntry.text("unchanged", label="status")
+    else:
+        yield dg.AssetMaterialization(
+            asset_key=dg.AssetKey(obj_name),
+            description=f" {obj_name.upper()} was saved <----------------------",
+            metadata_entries=[dg.EventMetadataEntry.text(fingerprint, "sha256")],
+        )
+
+
+def csv_content(df):
+    """The bytes the io managers write for df, sorted by its text index."""
+    df.index = df.index.astype(str)
+    df.sort_index(inplace=True, kind="mergesort")
+    return df.to_csv().encode("utf-8")
 
 
 class PandasCsvIOManager(dg.IOManager):
@@ -21,21 +72,18 @@ class PandasCsvIOManager(dg.IOManager):
 
     def handle_output(self, context, obj):
         obj_name = context.name
-        obj.index = obj.index.astype(str)
-        obj.sort_index(inplace=True)
+        if obj is None:
+            context.log.info(f"{obj_name.upper()} has nothing to save")
+            return
 
         if obj_name.startswith("imp"):
             file_path = os.path.join("data", "output", obj_name)
         else:
             file_path = os.path.join("data", "output", obj_name)
 
-        obj.to_csv(file_path + ".csv")
+        fingerprint = write_if_changed(file_path + ".csv", csv_content(obj))
 
-        yield dg.AssetMaterialization(
-            asset_key=dg.AssetKey(obj_name),
-            description=f" {obj_name.upper()} was saved <----------------------",
-            # metadata={"number of rows": dg.EventMetadata.int(len(obj))},
-        )
+        yield from output_events(context, obj_name, fingerprint)
         # yield dg.EventMetadataEntry.text(obj.shape[0], label="number of rows")
         # metadata={"head": dg.EventMetadata.md(obj.head(5).to_markdown())}
         # EventMetadataEntry.md(obj.head(5).to_markdown(), "head(5)")
@@ -46,25 +94,378 @@ def df_csv_io_manager(init_context):
     return PandasCsvIOManager()
 
 
+class PandasParquetIOManager(dg.IOManager):
+    """Typed parquet outputs, with an optional csv copy for the data submodule."""
+
+    def __init__(self, export_csv=True):
+        self.export_csv = export_csv
+
+    def load_input(self, context):
+        file_path = os.path.join("data", "output", context.upstream_output.name)
+        return pd.read_parquet(file_path + ".parquet")
+
+    def handle_output(self, context, obj):
+        obj_name = context.name
+        obj.index = obj.index.astype(str)
+        obj.sort_index(inplace=True, kind="mergesort")
+        file_path = os.path.join("data", "output", obj_name)
+
+        # csv first, so the parquet is never older than the csv it matches
+        fingerprint = None
+        if self.export_csv:
+            fingerprint = write_if_changed(file_path + ".csv", csv_content(obj))
+        parquet_fingerprint = write_if_changed(file_path + ".parquet", to_parquet(obj))
+        fingerprint = parquet_fingerprint or fingerprint
+
+        yield from output_events(context, obj_name, fingerprint)
+
+
+def to_parquet(df):
+    # parquet needs one type per column: mixed object columns are saved as text
+    df = df.copy()
+    df.columns = df.columns.astype(str)
+    for column in df.select_dtypes("object").columns:
+        if pd.api.types.infer_dtype(df[column], skipna=True) not in ("string", "empty"):
+            df[column] = df[column].where(df[column].isna(), df[column].astype(str))
+    buffer = io.BytesIO()
+    df.to_parquet(buffer)
+    return buffer.getvalue()
+
+
+@dg.io_manager(
+    config_schema={"export_csv": dg.Field(dg.Bool, is_required=False, default_value=True)}
+)
+def df_parquet_io_manager(init_context):
+    return PandasParquetIOManager(export_csv=init_context.resource_config["export_csv"])
+
+
+def file_digest(path, chunk_size=1 << 20):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def round_coordinates(coordinates, precision):
+    if isinstance(coordinates, (int, float)):
+        return round(coordinates, precision)
+    return [round_coordinates(c, precision) for c in coordinates]
+
+
+def compact_feature(feature, precision=None):
+    geometry = feature["geometry"]
+    if hasattr(geometry, "__geo_interface__"):
+        geometry = geometry.__geo_interface__
+    geometry = dict(geometry)
+    if precision is not None and "coordinates" in geometry:
+        geometry["coordinates"] = round_coordinates(geometry["coordinates"], precision)
+    return {**feature, "geometry": geometry}
+
+
+def write_feature_collection(path, features, precision=None):
+    """Stream features to path as compact GeoJSON, one feature per line.
+
+    The file is written to a temp file and renamed into place, unless the
+    result is identical to what is already there. Returns the sha256 of
+    the content, or None when unchanged.
+    """
+    digest = hashlib.sha256()
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path) or ".", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+
+            def write(text):
+                f.write(text)
+                digest.update(text.encode("utf-8"))
+
+            write('{"type":"FeatureCollection","features":[')
+            for i, feature in enumerate(features):
+                text = json.dumps(
+                    compact_feature(feature, precision),
+                    ensure_ascii=False,
+                    separators=(",", ":"),
+                )
+                write(("," if i else "") + "\n" + text)
+            write("\n]}\n")
+
+        fingerprint = digest.hexdigest()
+        if os.path.exists(path) and file_digest(path) == fingerprint:
+            os.remove(tmp_path)
+            return None
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return fingerprint
+
+
+def viewcone_sidecars(path):
+    base = os.path.splitext(path)[0]
+    return base + ".attributes.parquet", base + ".ids.csv"
+
+
+def sidecars_fresh(path):
+    return all(
+        os.path.exists(sidecar) and os.path.getmtime(sidecar) >= os.path.getmtime(path)
+        for sidecar in viewcone_sidecars(path)
+    )
+
+
+def write_sidecars(path, features, precision=None):
+    """Cache a GeoJSON as a parquet attribute table and an id manifest.
+
+    The attribute table keeps every property plus the geometry as WKB, so
+    loaders can skip GeoJSON parsing, and geometry parsing altogether when
+    they only need attributes.
+    """
+    attributes_path, ids_path = viewcone_sidecars(path)
+    features = [compact_feature(feature, precision) for feature in features]
+    attributes = pd.DataFrame([feature["properties"] for feature in features])
+    attributes["geometry"] = [shape(feature["geometry"]).wkb for feature in features]
+
+    attributes.to_parquet(attributes_path + ".tmp")
+    os.replace(attributes_path + ".tmp", attributes_path)
+    attributes[["id"]].to_csv(ids_path + ".tmp", index=False)
+    os.replace(ids_path + ".tmp", ids_path)
+
+
+def read_viewcones(path, columns=None):
+    """Load a GeoJSON written by GeojsonIOManager, through its sidecars if fresh.
+
+    Geometry is decoded only when no columns are given or "geometry" is
+    among them; otherwise a plain DataFrame is returned.
+    """
+    if not sidecars_fresh(path):
+        gdf = gpd.read_file(path)
+        return gdf if columns is None else gdf[columns]
+
+    attributes_path, ids_path = viewcone_sidecars(path)
+    if columns == ["id"]:
+        return pd.read_csv(ids_path, dtype=str)
+
+    df = pd.read_parquet(attributes_path, columns=columns)
+    if "geometry" not in df.columns:
+        return df
+    geometry = gpd.GeoSeries.from_wkb(df.pop("geometry"), crs="EPSG:4326")
+    return gpd.GeoDataFrame(df, geometry=geometry)
+
+
+INDEXED_FORMATS = {"GPKG": ".gpkg", "FlatGeobuf": ".fgb"}
+
+
 class GeojsonIOManager(dg.IOManager):
+    """Compact GeoJSON outputs, with an optional spatially indexed copy.
+
+    The indexed copy (GeoPackage or FlatGeobuf) can be read by bounding box
+    without loading the whole collection: gpd.read_file(path, bbox=...).
+    """
+
+    def __init__(self, precision=None, indexed=None):
+        self.precision = precision
+        self.indexed = indexed
+
     def load_input(self, context):
         file_path = os.path.join("data", "output", context.upstream_output.name)
-        return gpd.read_file(file_path + ".geojson")  # retorno um df
+        return read_viewcones(file_path + ".geojson")  # retorno um df
 
     def handle_output(self, context, feature_collection):
+        if feature_collection is None:
+            context.log.info(f"{context.name.upper()} has nothing to save")
+            return
+
         file_path = os.path.join("data", "output", context.name) + ".geojson"
-        with open(file_path, "w", encoding="utf-8") as f:
-            geojson.dump(feature_collection, f, ensure_ascii=False, indent=4)
+        # stable order, so the data submodule only sees changed features
+        features = sorted(
+            feature_collection["features"],
+            key=lambda feature: str(feature["properties"].get("id", "")),
+        )
+        fingerprint = write_feature_collection(file_path, features, self.precision)
+
+        if fingerprint or not sidecars_fresh(file_path):
+            write_sidecars(file_path, features, self.precision)
+
+        if self.indexed:
+            index_path = os.path.splitext(file_path)[0] + INDEXED_FORMATS[self.indexed]
+            if fingerprint or not os.path.exists(index_path):
+                self.write_indexed(index_path, features)
+
+        if fingerprint is None:
+            context.log.info(
+                f"{context.name.upper()} is unchanged, nothing was written"
+            )
+            yield dg.EventMetadataEntry.text("unchanged", label="status")
+            return
 
         yield dg.AssetMaterialization(
             asset_key=dg.AssetKey(file_path),
             description=f" {context.name.upper()} was saved <----------------------",
+            metadata_entries=[dg.EventMetadataEntry.text(fingerprint, "sha256")],
         )
 
-
-@dg.io_manager
+    def write_indexed(self, path, features):
+        gdf = gpd.GeoDataFrame.from_features(
+            [compact_feature(feature, self.precision) for feature in features],
+            crs="EPSG:4326",
+        )
+        tmp_path = path + ".tmp" + INDEXED_FORMATS[self.indexed]
+        gdf.to_file(tmp_path, driver=self.indexed)
+        os.replace(tmp_path, path)
+
+
+@dg.io_manager(
+    config_schema={
+        "precision": dg.Field(dg.Int, is_required=False, default_value=6),
+        "indexed": dg.Field(
+            dg.Enum(
+                "IndexedFormat", [dg.EnumValue(name) for name in INDEXED_FORMATS]
+            ),
+            is_required=False,
+        ),
+    }
+)
 def geojson_io_manager(init_context):
-    return GeojsonIOManager()
+    return GeojsonIOManager(
+        precision=init_context.resource_config["precision"],
+        indexed=init_context.resource_config.get("indexed"),
+    )
+
+
+class MetadataIndex:
+    """id -> record lookups over metadata.csv.
+
+    The file is parsed once per modification time and shared by every
+    solid, and every run, in the process. Records are rows of one object
+    array, addressed through plain dicts of positions.
+    """
+
+    _loaded = {}
+
+    def __init__(self, df):
+        self.columns = {column: j for j, column in enumerate(df.columns)}
+        self.values = df.to_numpy(dtype=object)
+        ids = df["id"].astype(str)
+        self.positions = {id: i for i, id in enumerate(ids)}
+        self.upper_positions = {id.upper(): i for i, id in enumerate(ids)}
+
+    @classmethod
+    def load(cls, path):
+        mtime = os.path.getmtime(path)
+        loaded = cls._loaded.get(path)
+        if loaded is None or loaded[0] != mtime:
+            loaded = (mtime, cls(pd.read_csv(path)))
+            cls._loaded[path] = loaded
+        return loaded[1]
+
+    def __contains__(self, id):
+        return id in self.positions
+
+    def position(self, id, ignore_case=False):
+        if ignore_case:
+            return self.upper_positions[id.upper()]
+        return self.positions[id]
+
+    def get(self, id, column, ignore_case=False):
+        return self.values[self.position(id, ignore_case), self.columns[column]]
+
+    def record(self, id, ignore_case=False, fill=None):
+        row = self.values[self.position(id, ignore_case)]
+        if fill is None:
+            return dict(zip(self.columns, row))
+        return {
+            column: fill if pd.isna(value) else value
+            for column, value in zip(self.columns, row)
+        }
+
+
+@dg.resource(config_schema=dg.StringSource)
+def metadata_index(init_context):
+    return MetadataIndex.load(init_context.resource_config)
+
+
+@dg.resource(
+    config_schema={
+        "path": dg.StringSource,
+        "ttl_days": dg.Field(dg.Int, is_required=False, default_value=30),
+        "max_size_mb": dg.Field(dg.Int, is_required=False, default_value=512),
+    }
+)
+def http_cache(init_context):
+    """Conditional-request cache for the API harvests, trimmed on start."""
+    config = init_context.resource_config
+    cache = HttpCache(
+        config["path"],
+        ttl=config["ttl_days"] * 24 * 3600,
+        max_size=config["max_size_mb"] * 2 ** 20,
+    )
+    cache.evict()
+    return cache
+
+
+@dg.resource(
+    config_schema={
+        "rate": dg.Field(
+            dg.Float,
+            is_required=False,
+            default_value=4.0,
+            description="Requests per second to each host",
+        ),
+        "burst": dg.Field(dg.Int, is_required=False, default_value=4),
+        "rates": dg.Field(
+            dg.Permissive(),
+            is_required=False,
+            default_value={},
+            description="Requests per second for specific hosts, by host name",
+        ),
+        "retries": dg.Field(dg.Int, is_required=False, default_value=3),
+        "pool_size": dg.Field(dg.Int, is_required=False, default_value=10),
+        "timeout": dg.Field(dg.Float, is_required=False, default_value=60.0),
+    }
+)
+def http_client(init_context):
+    """Shared HTTP client: pooled connections and per-host rate limits."""
+    config = init_context.resource_config
+    client = HttpClient(
+        rate=config["rate"],
+        burst=config["burst"],
+        rates=config["rates"],
+        retries=config["retries"],
+        pool_size=config["pool_size"],
+        timeout=config["timeout"],
+    )
+    try:
+        yield client
+    finally:
+        for host, stats in client.metrics().items():
+            init_context.log.info(
+                f"{host}: {stats['requests']} requests, {stats['retries']} retries, "
+                f"{stats['errors']} errors, mean {stats['mean']:.2f}s, "
+                f"slowest {stats['slowest']:.2f}s"
+            )
+        client.close()
+
+
+@dg.resource(
+    config_schema={
+        "path": dg.StringSource,
+        "ttl_days": dg.Field(dg.Int, is_required=False, default_value=90),
+        "chunk_size": dg.Field(
+            dg.Int,
+            is_required=False,
+            default_value=200,
+            description="Q-ids per SPARQL query",
+        ),
+    }
+)
+def coordinate_cache(init_context):
+    """Wikidata coordinates of depicted entities, kept on disk between runs."""
+    config = init_context.resource_config
+    return CoordinateCache(
+        config["path"],
+        ttl=config["ttl_days"] * 24 * 3600,
+        chunk_size=config["chunk_size"],
+    )
 
 
 @dg.solid
@@ -73,17 +474,91 @@ def rename_column(context, df, dic):
     return df
 
 
+def format_years(df):
+    # blanks and other non-numeric years are left as they are
+    for column in ["first_year", "last_year"]:
+        if column in df.columns:
+            years = pd.to_numeric(df[column], errors="coerce")
+            formatted = years.map(lambda x: x if pd.isnull(x) else str(int(x)))
+            df[column] = formatted.where(years.notna(), df[column])
+    return df
+
+
+def export_metadata(context):
+    """Write metadata.csv from the store, under its write lock.
+
+    The typed metadata.parquet next to it is refreshed too, if there is one.
+    """
+    store = context.resources.metadata_store
+    written = []
+
+    def write(metadata):
+        content = csv_content(metadata)
+        written.append(write_if_changed(store.export_path, content))
+        parquet = os.path.splitext(store.export_path)[0] + ".parquet"
+        if os.path.exists(parquet):
+            write_if_changed(parquet, to_parquet(metadata))
+        return hashlib.sha256(content).hexdigest()
+
+    store.export(write)
+    if written[0] is None:
+        context.log.info("METADATA is unchanged, nothing was written")
+    else:
+        yield dg.AssetMaterialization(
+            asset_key=dg.AssetKey("metadata"),
+            description=" METADATA was saved <----------------------",
+            metadata_entries=[dg.EventMetadataEntry.text(written[0], "sha256")],
+        )
+
+
+@dg.resource(config_schema={"path": dg.StringSource, "seed": dg.StringSource})
+def metadata_store(init_context):
+    """sqlite metadata table, seeded from metadata.csv when empty or when the
+    csv is not one the store exported (e.g. after a pull)."""
+    seed = init_context.resource_config["seed"]
+    store = MetadataStore(init_context.resource_config["path"], export_path=seed)
+    if os.path.exists(seed):
+        with open(seed, "rb") as f:
+            fingerprint = hashlib.sha256(f.read()).hexdigest()
+        if len(store) == 0 or not store.exported(fingerprint):
+            init_context.log.info(f"Seeding the metadata store from {seed}")
+            store.replace(format_years(pd.read_csv(seed, index_col="id")))
+            store.mark_exported(fingerprint)
+    return store
+
+
+@dg.solid(
+    required_resource_keys={"metadata_store"},
+    output_defs=[dg.OutputDefinition(dg.Nothing, name="metadata")],
+)
+def update_metadata(context, df):
+    yield from upsert_metadata(context, [df])
+
+
 @dg.solid(
-    input_defs=[dg.InputDefinition("metadata", root_manager_key="metadata_root")],
-    output_defs=[dg.OutputDefinition(io_manager_key="pandas_csv", name="metadata")],
+    input_defs=[dg.InputDefinition("dfs", dg.List[dg.Any])],
+    required_resource_keys={"metadata_store"},
+    output_defs=[dg.OutputDefinition(dg.Nothing, name="metadata")],
 )
-def update_metadata(_, df, metadata):
-    metadata.set_index("id", inplace=True)
-    metadata.update(df)
-    metadata[["first_year", "last_year"]] = metadata[
-        ["first_year", "last_year"]
-    ].applymap(lambda x: x if pd.isnull(x) else str(int(x)))
-    return metadata
+def update_metadata_batch(context, dfs):
+    """Fan-in version of update_metadata: one transaction for all sources."""
+    yield from upsert_metadata(context, [df for df in dfs if df is not None])
+
+
+def upsert_metadata(context, dfs):
+    # later frames win, as with successive DataFrame.update calls
+    updates = None
+    for df in dfs:
+        updates = df if updates is None else df.combine_first(updates)
+
+    store = context.resources.metadata_store
+    if updates is not None:
+        context.log.info(f"Updating {len(updates)} metadata records")
+        store.update(format_years(updates.copy()))
+
+    # metadata.csv is now an export of the store
+    yield from export_metadata(context)
+    yield dg.Output(None, "metadata")
 
 
 @dg.io_manager
@@ -97,9 +572,44 @@ def root_input_xls(context):
     return pd.read_excel(path)
 
 
+def projection(context):
+    """Columns and dtypes declared in the InputDefinition metadata, if any.
+
+    InputDefinition("camera", root_manager_key="camera_root",
+                    metadata={"columns": {"id": "str"}})
+    """
+    columns = (context.metadata or {}).get("columns")
+    if not columns:
+        return None, None
+    dtypes = {column: dtype for column, dtype in columns.items() if dtype is not None}
+    return list(columns), dtypes
+
+
 @dg.root_input_manager(config_schema=dg.StringSource)
 def root_input_csv(context):
-    return pd.read_csv(context.resource_config)
+    usecols, dtypes = projection(context)
+    return pd.read_csv(context.resource_config, usecols=usecols, dtype=dtypes)
+
+
+@dg.root_input_manager(config_schema=dg.StringSource)
+def root_input_parquet(context):
+    # read the typed parquet written next to the csv, unless the csv is newer
+    # (updated by a default-mode run or a pull)
+    csv_path = context.resource_config
+    path = os.path.splitext(csv_path)[0] + ".parquet"
+    usecols, dtypes = projection(context)
+    if os.path.exists(path) and (
+        not os.path.exists(csv_path)
+        or os.path.getmtime(path) >= os.path.getmtime(csv_path)
+    ):
+        df = pd.read_parquet(path, columns=usecols).reset_index()
+        if usecols:
+            df = df[usecols].copy()
+            # like read_csv(dtype=str): cast the values, keep missing cells NaN
+            for column, dtype in dtypes.items():
+                df[column] = df[column].where(df[column].isna(), df[column].astype(dtype))
+        return df
+    return pd.read_csv(csv_path, usecols=usecols, dtype=dtypes)
 
 
 @dg.root_input_manager(config_schema=dg.StringSource)
@@ -111,57 +621,92 @@ def root_input_xml(context):
     return root
 
 
+@dg.root_input_manager(config_schema=dg.StringSource)
+def root_input_path(context):
+    return context.resource_config
+
+
 @dg.root_input_manager(config_schema=dg.StringSource)
 def root_input_geojson(context):
-    return gpd.read_file(context.resource_config)  # retorn geopandas
+    usecols, _ = projection(context)
+    return read_viewcones(context.resource_config, usecols)  # retorn geopandas
 
 
-@dg.solid
+def git_failure(error):
+    if isinstance(error, subprocess.TimeoutExpired):
+        return dg.Failure(f"{' '.join(error.cmd)} timed out after {error.timeout}s")
+    return dg.Failure(
+        f"{' '.join(error.cmd)} failed",
+        metadata_entries=[dg.EventMetadataEntry.text(error.stderr or "", "stderr")],
+    )
+
+
+@dg.solid(
+    config_schema={
+        "paths": dg.Field(
+            [str],
+            is_required=False,
+            default_value=DATA_PATHS,
+            description="Folders of the data submodule to check out, empty for all",
+        ),
+        "depth": dg.Field(dg.Int, is_required=False, default_value=1),
+        "timeout": dg.Field(dg.Int, is_required=False, default_value=600),
+    }
+)
 def pull_new_data(context):
-    comands = ["git", "submodule", "update", "--init", "--recursive"]
-    pull = subprocess.Popen(comands)
+    config = context.solid_config
+    try:
+        output = pull_submodule("data", config["paths"], config["depth"], config["timeout"])
+    except (subprocess.CalledProcessError, subprocess.TimeoutExpired) as error:
+        raise git_failure(error)
+    context.log.info(output or "data is up to date")
 
 
-@dg.solid
+@dg.solid(
+    config_schema={
+        "message": dg.Field(
+            dg.String, is_required=False, default_value=":card_file_box: Update data"
+        ),
+        "branch": dg.Field(dg.String, is_required=False, default_value="main"),
+        "etl_branch": dg.Field(
+            dg.String, is_required=False, default_value="feature/dagster-submodule"
+        ),
+        "timeout": dg.Field(dg.Int, is_required=False, default_value=600),
+    }
+)
 def push_new_data(context):
-    submodule_push = [
-        "pwd",
-        "git checkout main",
-        "git commit -a -m ':card_file_box: Update data'",
-        "git push",
-    ]
-
-    for command in submodule_push:
-        git_cli_sub = subprocess.Popen(
-            command,
-            shell=True,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            universal_newlines=True,
-            cwd="data",
+    config = context.solid_config
+    try:
+        report = push_submodule(
+            "data", config["message"], config["branch"], config["timeout"]
         )
-        output, errors = git_cli_sub.communicate()
-        if "nothing" in output:
-            break
-            print(f"command: {command} \noutput: {output} \nERRO: {errors}")
-
-    etl_push = [
-        "pwd",
-        "git checkout feature/dagster-submodule",
-        "git add data",
-        "git commit -m ':card_file_box: Update submodule'",
-        "git push",
-    ]
-
-    for command in etl_push:
-        git_cli_etl = subprocess.Popen(
-            command,
-            shell=True,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            universal_newlines=True,
-            cwd=".",
-        )
-
-        output, errors = git_cli_etl.communicate()
-        print(f"command: {command} \noutput: {output} \nERRO: {errors}")
+        if report:
+            bump_submodule(
+                "data",
+                ":card_file_box: Update submodule",
+                config["etl_branch"],
+                config["timeout"],
+            )
+    except (subprocess.CalledProcessError, subprocess.TimeoutExpired) as error:
+        raise git_failure(error)
+
+    if not report:
+        context.log.info("nothing to commit in data")
+        yield dg.Output(report)
+        return
+
+    summary = "\n".join(
+        f"| {path} | {rows['added']} | {rows['removed']} |"
+        for path, rows in sorted(report.items())
+    )
+    yield dg.AssetMaterialization(
+        asset_key=dg.AssetKey("data"),
+        description=f"{len(report)} files pushed to data",
+        metadata_entries=[
+            dg.EventMetadataEntry.md(
+                "| file | added | removed |\n|---|---|---|\n" + summary,
+                "changed rows",
+            )
+        ],
+    )
+    yield dg.Output(report)
@@ -0,0 +1,63 @@
+from functools import lru_cache
+
+import numpy as np
+from pyproj import Transformer
+from shapely.geometry import Polygon
+
+LNGLAT = "EPSG:4326"
+PROJECTED = "EPSG:32722"
+
+
+@lru_cache(maxsize=None)
+def transformer(inverse=False):
+    source, target = (PROJECTED, LNGLAT) if inverse else (LNGLAT, PROJECTED)
+    return Transformer.from_crs(source, target, always_xy=True)
+
+
+def to_projected(lng, lat):
+    return transformer().transform(
+        np.asarray(lng, dtype=float), np.asarray(lat, dtype=float)
+    )
+
+
+def to_lnglat(x, y):
+    return transformer(inverse=True).transform(x, y)
+
+
+def distances(lng, lat, to_lng, to_lat):
+    """Metres from the point lng, lat to each of to_lng, to_lat."""
+    x, y = to_projected(np.append(to_lng, lng), np.append(to_lat, lat))
+    return np.hypot(x[:-1] - x[-1], y[:-1] - y[-1])
+
+
+def cone_vertices(lng, lat, heading, left_fov, right_fov, radius, steps=200):
+    """Outlines of the view cones of n cameras, as an (n, steps + 3, 2) array
+    of longitude, latitude: the camera, an arc of steps segments from the
+    right to the left edge of the view at radius metres, the camera again.
+    """
+    lng, lat, heading, left_fov, right_fov, radius = (
+        np.atleast_1d(np.asarray(values, dtype=float))
+        for values in (lng, lat, heading, left_fov, right_fov, radius)
+    )
+    start = heading - right_fov
+    end = heading - left_fov
+    start = np.where(start > end, start - 360, start)
+    step = (end - start) / steps
+    angles = np.radians(start[:, None] + step[:, None] * np.arange(steps + 1))
+
+    x, y = to_projected(lng, lat)
+    xs = np.empty((len(x), steps + 3))
+    ys = np.empty((len(y), steps + 3))
+    xs[:, 0] = xs[:, -1] = x
+    ys[:, 0] = ys[:, -1] = y
+    xs[:, 1:-1] = x[:, None] + np.sin(angles) * radius[:, None]
+    ys[:, 1:-1] = y[:, None] + np.cos(angles) * radius[:, None]
+
+    lng, lat = to_lnglat(xs.ravel(), ys.ravel())
+    return np.stack([lng, lat], axis=-1).reshape(xs.shape + (2,))
+
+
+def draw_cones(lng, lat, heading, left_fov, right_fov, radius, steps=200):
+    """View cone polygons of n cameras, built in a single reprojection."""
+    vertices = cone_vertices(lng, lat, heading, left_fov, right_fov, radius, steps)
+    return [Polygon(outline) for outline in vertices]